@@ -1,32 +1,12 @@
-import os
-import json
-import webbrowser
-import requests
+import time
+import queue
 import threading
 import tkinter as tk
 from tkinter import ttk, messagebox, StringVar, IntVar
-from typing import List, Dict, Set, Tuple
-import re
+from typing import List, Dict, Tuple
 from datetime import datetime
-from openai import OpenAI
-from bs4 import BeautifulSoup
-
-# --- Helper Functions ---
-def debug_log(message: str):
-    """Print detailed debug messages to the console."""
-    print(message)
-
-def normalize_show_name(name: str) -> str:
-    """
-    Normalize a show name by lowercasing and removing punctuation and extra whitespace.
-    """
-    name = name.lower().strip()
-    name = re.sub(r"[’'\",:;\-]", "", name)
-    name = re.sub(r"\s+", " ", name)
-    return name
-
-def current_timestamp() -> str:
-    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+from anime_tracker_engine import TrackerEngine
 
 # --- Dialog Classes ---
 class AddShowDialog(tk.Toplevel):
@@ -278,6 +258,7 @@ class EditKnownShowsDialog(tk.Toplevel):
 
 # --- Main Application Class ---
 class AnimeTrackerApp:
+    """Tk front end for TrackerEngine. Scans run on a background thread."""
     def __init__(self, root):
         self.root = root
         self.root.title("Anime Tracker Pro")
@@ -286,26 +267,26 @@ class AnimeTrackerApp:
 
         # Configuration
         self.config = {
-            'openai_model': 'gpt-4o-mini',
-            'nyaa_url': 'https://nyaa.si/',
-            'known_shows_file': 'known_shows.json'
+            # Lines kept in the GUI log; older lines are dropped as new ones arrive.
+            'log_max_lines': 5000,
+            'log_flush_ms': 100
         }
-        self.known_shows = self.load_known_shows()
-
-        # State
-        self.tracked_shows = []
-
-        # Stop event for scanning
-        self.stop_scan_event = threading.Event()
+        self.ui_queue: "queue.Queue[Tuple]" = queue.Queue()
+        self.engine = TrackerEngine(
+            on_log=lambda lines: self.ui_queue.put(('log', lines)),
+            on_status=self.set_status,
+            on_episodes_changed=lambda show, pairs: self.ui_queue.put(('episodes', (show['id'], pairs)))
+        )
+        self.tree_show = None
+        self.tree_seasons: Dict[int, List[int]] = {}
 
         # GUI Setup
         self.create_widgets()
         self.setup_layout()
-
-        self.load_state()
         self.update_show_list()
 
-        self.root.after(100, self.recalculate_needed_for_all_shows)
+        self.root.after(self.config['log_flush_ms'], self.drain_ui_queue)
+        self.root.after(self.engine.config['poll_tick_seconds'] * 1000, self.poll_tick)
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
 
     def create_widgets(self):
@@ -319,6 +300,10 @@ class AnimeTrackerApp:
         self.btn_scan = ttk.Button(self.control_frame, text="Scan Now", command=self.toggle_scan)
         self.btn_edit_known_shows = ttk.Button(self.control_frame, text="Edit Known Shows", command=self.edit_known_shows_gui)
         self.btn_reset_show = ttk.Button(self.control_frame, text="Reset Show", command=self.reset_show)
+        self.feed_mode_var = tk.BooleanVar(value=self.engine.config['scan_mode'] == 'feed')
+        self.chk_feed_mode = ttk.Checkbutton(self.control_frame, text="Feed Mode", variable=self.feed_mode_var)
+        self.auto_poll_var = tk.BooleanVar(value=self.engine.config['auto_poll'])
+        self.chk_auto_poll = ttk.Checkbutton(self.control_frame, text="Auto Poll", variable=self.auto_poll_var)
 
         # Tracked Shows List
         self.tracked_frame = ttk.LabelFrame(self.main_frame, text="Tracked Shows")
@@ -328,12 +313,14 @@ class AnimeTrackerApp:
         # Episode Status Treeview
         self.episodes_frame = ttk.LabelFrame(self.main_frame, text="Episodes")
         self.episodes_tree = ttk.Treeview(self.episodes_frame, columns=('Season', 'Episode', 'Status'),
-                                          show='headings', style='Custom.Treeview')
+                                          show='tree headings', style='Custom.Treeview')
+        self.episodes_tree.column('#0', width=30, stretch=False)
         self.episodes_tree.heading('Season', text='Season', anchor=tk.W)
         self.episodes_tree.heading('Episode', text='Episode', anchor=tk.W)
         self.episodes_tree.heading('Status', text='Status', anchor=tk.W)
         self.episodes_tree.tag_configure('downloaded', foreground='green')
         self.episodes_tree.tag_configure('needed', foreground='red')
+        self.episodes_tree.tag_configure('more', foreground='gray')
         self.episodes_scroll = ttk.Scrollbar(self.episodes_frame)
 
         # Log Panel
@@ -357,6 +344,8 @@ class AnimeTrackerApp:
         self.btn_scan.pack(side=tk.LEFT, padx=5)
         self.btn_edit_known_shows.pack(side=tk.LEFT, padx=5)
         self.btn_reset_show.pack(side=tk.LEFT, padx=5)
+        self.chk_feed_mode.pack(side=tk.LEFT, padx=5)
+        self.chk_auto_poll.pack(side=tk.LEFT, padx=5)
 
         self.tracked_frame.grid(row=1, column=0, sticky=tk.NSEW, padx=5, pady=5)
         self.listbox.grid(row=0, column=0, sticky=tk.NSEW, padx=5, pady=5)
@@ -389,88 +378,173 @@ class AnimeTrackerApp:
 
         self.listbox.bind('<<ListboxSelect>>', self.on_show_selected)
         self.listbox.bind("<Double-Button-1>", self.edit_show)
+        self.episodes_tree.bind('<<TreeviewOpen>>', self.on_season_open)
+        self.episodes_tree.bind('<<TreeviewSelect>>', self.on_episode_selected)
 
     def on_show_selected(self, event):
         selection = self.listbox.curselection()
         if selection:
-            selected_show = self.tracked_shows[selection[0]]
+            selected_show = self.engine.tracked_shows[selection[0]]
             self.update_episodes_tree(selected_show)
 
+    EPISODE_PAGE_SIZE = 200
+
     def update_episodes_tree(self, show):
-        for item in self.episodes_tree.get_children():
-            self.episodes_tree.delete(item)
-        
-        for season in range(show['start_season'], show['end_season'] + 1):
-            if show['names'][0] in self.known_shows:
-                eps_per_season = self.get_episodes_per_season(show, season)
-            else:
-                eps_per_season = show['end_episode']
-
-            start_ep = show['start_episode'] if season == show['start_season'] else 1
-            end_ep = show['end_episode'] if season == show['end_season'] else eps_per_season
-
-            for ep in range(start_ep, end_ep + 1):
-                if show['downloaded_episodes'].get(season) and ep in show['downloaded_episodes'][season]:
-                    status = 'Downloaded'
-                    tags = ('downloaded',)
-                elif show['needed_episodes'].get(season) and ep in show['needed_episodes'][season]:
-                    status = 'Needed'
-                    tags = ('needed',)
-                else:
+        """
+        Show one summary row per season. Episode rows are only created when a season is
+        expanded, EPISODE_PAGE_SIZE at a time, so selecting a long show stays fast.
+        """
+        tree = self.episodes_tree
+        tree.delete(*tree.get_children())
+        self.tree_show = show
+        # season -> [first episode, last episode, last episode row created]
+        self.tree_seasons = {}
+        with self.engine.state_lock:
+            for season, first, last in self.engine.tracking_ranges(show):
+                self.tree_seasons[season] = [first, last, first - 1]
+                tree.insert('', 'end', iid=f"s{season}", values=self.season_summary(show, season),
+                            tags=('season',))
+                # Placeholder child so the season can be expanded before its rows exist.
+                tree.insert(f"s{season}", 'end', iid=f"s{season}pending")
+
+    def season_summary(self, show, season) -> Tuple[str, str, str]:
+        first, last, _ = self.tree_seasons[season]
+        downloaded = show['downloaded_episodes'].count_range(season, first, last)
+        return f"S{season:02d}", f"E{first:02d}-E{last:02d}", f"{downloaded}/{last - first + 1} downloaded"
+
+    @staticmethod
+    def episode_status(show, season, episode):
+        if (season, episode) in show['downloaded_episodes']:
+            return 'Downloaded', ('downloaded',)
+        if (season, episode) in show['needed_episodes']:
+            return 'Needed', ('needed',)
+        return None, ()
+
+    def load_episode_page(self, season):
+        """Create the next page of episode rows for an expanded season."""
+        tree = self.episodes_tree
+        show = self.tree_show
+        first, last, loaded = self.tree_seasons[season]
+        for placeholder in (f"s{season}pending", f"s{season}more"):
+            if tree.exists(placeholder):
+                tree.delete(placeholder)
+
+        end = min(last, loaded + self.EPISODE_PAGE_SIZE)
+        with self.engine.state_lock:
+            for ep in range(loaded + 1, end + 1):
+                status, tags = self.episode_status(show, season, ep)
+                if status is None:
+                    continue
+                tree.insert(f"s{season}", 'end', iid=f"s{season}e{ep}",
+                            values=(f"S{season:02d}", f"E{ep:02d}", status), tags=tags)
+        self.tree_seasons[season][2] = end
+        if end < last:
+            tree.insert(f"s{season}", 'end', iid=f"s{season}more",
+                        values=("", f"{last - end} more...", ""), tags=('more',))
+
+    def on_season_open(self, event):
+        item = self.episodes_tree.focus()
+        if item.startswith('s') and item[1:].isdigit():
+            season = int(item[1:])
+            first, _, loaded = self.tree_seasons[season]
+            if loaded < first:
+                self.load_episode_page(season)
+
+    def on_episode_selected(self, event):
+        for item in self.episodes_tree.selection():
+            if item.endswith('more'):
+                self.load_episode_page(int(item[1:-len('more')]))
+
+    def refresh_episode_rows(self, show_id, pairs):
+        """Update only the rows of episodes whose status changed during a scan."""
+        show = self.tree_show
+        if show is None or show['id'] != show_id:
+            return
+        tree = self.episodes_tree
+        seasons = set()
+        with self.engine.state_lock:
+            for season, episode in pairs:
+                if season not in self.tree_seasons:
                     continue
+                seasons.add(season)
+                iid = f"s{season}e{episode}"
+                if tree.exists(iid):
+                    status, tags = self.episode_status(show, season, episode)
+                    tree.item(iid, values=(f"S{season:02d}", f"E{episode:02d}", status), tags=tags)
+            for season in seasons:
+                tree.item(f"s{season}", values=self.season_summary(show, season))
 
-                self.episodes_tree.insert('', 'end', values=(f"S{season:02d}", f"E{ep:02d}", status), tags=tags)
+    def log(self, message: str, level: str = "info"):
+        self.engine.log(message, level)
 
-    def get_episodes_per_season(self, show, season):
-        primary_name = show['names'][0]
-        if primary_name in self.known_shows:
-            eps_data = self.known_shows[primary_name].get('episodes_per_season', 12)
-            if isinstance(eps_data, list):
-                return eps_data[season - 1] if (season - 1) < len(eps_data) else 12
-            else:
-                return eps_data
-        else:
-            return show['end_episode']
+    def set_status(self, text: str):
+        """Update the status bar from any thread."""
+        self.ui_queue.put(('status', text))
 
-    def log(self, message: str, level: str = "info"):
-        """High-level logging to the GUI log."""
+    def drain_ui_queue(self):
+        """
+        Apply queued log lines, episode changes, status updates and scan completion in one
+        batch, then reschedule.
+        """
+        lines: List[Tuple[str, str]] = []
+        changed: Dict[str, List[Tuple[int, int]]] = {}
+        status = None
+        scan_done = False
+        while True:
+            try:
+                kind, payload = self.ui_queue.get_nowait()
+            except queue.Empty:
+                break
+            if kind == 'log':
+                lines.extend(payload)
+            elif kind == 'episodes':
+                show_id, pairs = payload
+                changed.setdefault(show_id, []).extend(pairs)
+            elif kind == 'done':
+                scan_done = True
+            else:
+                status = payload
+        if lines:
+            self.write_log(lines)
+        for show_id, pairs in changed.items():
+            self.refresh_episode_rows(show_id, pairs)
+        if status is not None:
+            self.status_var.set(status)
+        if scan_done:
+            self.on_scan_complete()
+        self.root.after(self.config['log_flush_ms'], self.drain_ui_queue)
+
+    def write_log(self, lines: List[Tuple[str, str]]):
         self.log_text.config(state=tk.NORMAL)
-        tag = level if level in ["info", "success", "error", "separator"] else "info"
-        self.log_text.insert(tk.END, f"{message}\n", tag)
-        if level == "separator":
-            self.log_text.insert(tk.END, "---" * 20 + "\n", "separator")
+        for message, level in lines:
+            tag = level if level in ["info", "success", "error", "separator"] else "info"
+            self.log_text.insert(tk.END, f"{message}\n", tag)
+            if level == "separator":
+                self.log_text.insert(tk.END, "---" * 20 + "\n", "separator")
+        excess = int(self.log_text.index('end-1c').split('.')[0]) - 1 - self.config['log_max_lines']
+        if excess > 0:
+            self.log_text.delete('1.0', f"{excess + 1}.0")
         self.log_text.see(tk.END)
         self.log_text.config(state=tk.DISABLED)
-        self.root.update_idletasks()
 
     def add_show(self):
         dialog = AddShowDialog(self.root)
         self.root.wait_window(dialog)
         if dialog.result:
-            new_show = {
-                **dialog.result,
-                'downloaded_episodes': {},
-                'needed_episodes': {},
-                'last_checked': None
-            }
-            self.tracked_shows.append(new_show)
-            self.recalculate_needed_for_show(new_show)
+            self.engine.add_show(dialog.result)
             self.update_show_list()
-            self.save_state()
-            self.log(f"Added new show: {new_show['names'][0]}", level="info")
 
     def remove_show(self):
         selection = self.listbox.curselection()
         if selection:
-            show = self.tracked_shows.pop(selection[0])
+            self.engine.remove_show(selection[0])
             self.update_show_list()
-            self.save_state()
-            self.log(f"Removed show: {show['names'][0]}", level="info")
             self.episodes_tree.delete(*self.episodes_tree.get_children())
+            self.tree_show = None
 
     def update_show_list(self):
         self.listbox.delete(0, tk.END)
-        for show in self.tracked_shows:
+        for show in self.engine.tracked_shows:
             primary_name = show['names'][0]
             text = f"{primary_name} - S{show['start_season']}E{show['start_episode']}→S{show['end_season']}E{show['end_episode']} ({show['quality']})"
             self.listbox.insert(tk.END, text)
@@ -481,386 +555,70 @@ class AnimeTrackerApp:
         else:
             self.stop_scan()
 
-    def start_scan(self):
+    def start_scan(self, due_only: bool = False):
         if not self.scanning:
             self.scanning = True
             self.btn_scan.config(text="Stop Search")
-            self.stop_scan_event.clear()
-            threading.Thread(target=self.scan_shows_threaded, daemon=True).start()
-            self.log("Started scanning shows.", level="info")
+            mode = 'feed' if self.feed_mode_var.get() else 'search'
+            threading.Thread(target=self.scan_shows_threaded, args=(mode, due_only), daemon=True).start()
+
+    def poll_tick(self):
+        """
+        With Auto Poll on, start a scan of the shows whose poll interval has elapsed, or in
+        Feed Mode a feed check once feed_poll_interval has passed.
+        """
+        if self.auto_poll_var.get() and not self.scanning:
+            if self.feed_mode_var.get():
+                next_poll = self.engine.next_feed_poll_time()
+            else:
+                next_poll = self.engine.next_poll_time()
+            if next_poll is not None and next_poll <= time.time():
+                self.start_scan(due_only=True)
+            elif next_poll is not None:
+                self.set_status(f"Next poll at {datetime.fromtimestamp(next_poll):%Y-%m-%d %H:%M}")
+        self.root.after(self.engine.config['poll_tick_seconds'] * 1000, self.poll_tick)
 
     def stop_scan(self):
         if self.scanning:
-            self.stop_scan_event.set()
+            self.engine.stop_scan()
             self.log("Stopping scan...", level="info")
             self.btn_scan.config(state=tk.DISABLED)
 
-    def scan_shows_threaded(self):
+    def scan_shows_threaded(self, mode: str, due_only: bool = False):
         try:
-            self.scan_shows()
+            self.engine.run_scan(mode, due_only)
         finally:
-            self.root.after(0, self.on_scan_complete)
+            self.ui_queue.put(('done', None))
 
     def on_scan_complete(self):
         self.scanning = False
         self.btn_scan.config(text="Scan Now", state=tk.NORMAL)
-        if self.stop_scan_event.is_set():
-            self.status_var.set("Scan stopped")
-            self.log("Scan was stopped by user.", level="info")
-        else:
-            self.status_var.set("Scan complete")
-            self.log("Scan completed successfully.", level="info")
-
-    def scan_shows(self):
-        for show in self.tracked_shows:
-            if self.stop_scan_event.is_set():
-                self.log("Scan stopped by user.", level="info")
-                break
-
-            self.log(f"=== Scanning Show: {show['names'][0]} ===", level="info")
-            self.status_var.set(f"Scanning {show['names'][0]}...")
-            self.root.update_idletasks()
-
-            # Sort needed episodes (as tuples of (season, episode))
-            needed_sorted = sorted(
-                [(season, ep) for season, episodes in show['needed_episodes'].items() for ep in episodes],
-                key=lambda x: (x[0], x[1])
-            )
-
-            # Iterate over needed episodes in order.
-            for season, episode in needed_sorted:
-                if self.stop_scan_event.is_set():
-                    self.log("Scan stopped by user.", level="info")
-                    return
-
-                self.log(f"  Checking Episode: S{season:02d}E{episode:02d}", level="info")
-                found = self.search_episode(show, season, episode)
-                if found:
-                    show['needed_episodes'][season].remove(episode)
-                    if not show['needed_episodes'][season]:
-                        del show['needed_episodes'][season]
-                    show['downloaded_episodes'].setdefault(season, set()).add(episode)
-                    self.save_state()
-                else:
-                    self.log(f"  Episode not found for {show['names'][0]} at S{season:02d}E{episode:02d}", level="info")
-                    # Assume later episodes are not out yet.
-                    break
-
-            show['last_checked'] = current_timestamp()
-            self.save_state()
-
-    def search_episode(self, show: Dict, season: int, episode: int) -> bool:
-        if self.stop_scan_event.is_set():
-            return False
-
-        queries = []
-        for name in show['names']:
-            queries.extend([
-                f"{name} S{season:02d}E{episode:02d} {show['quality']}",
-                f"{name} S{season} - {episode:02d} {show['quality']}"
-            ])
-
-        for query in queries:
-            if self.stop_scan_event.is_set():
-                self.log("Scan stopped by user during search.", level="info")
-                return False
-
-            self.log(f"   Trying search query: {query}", level="info")
-            params = {
-                'f': 0,
-                'c': '0_0',
-                'q': query,
-                's': 'seeders',
-                'o': 'desc'
-            }
-
-            try:
-                response = requests.get(self.config['nyaa_url'], params=params, timeout=10)
-                soup = BeautifulSoup(response.text, 'html.parser')
-
-                for row in soup.select('tr.danger, tr.default, tr.success'):
-                    if self.stop_scan_event.is_set():
-                        self.log("Scan stopped by user during torrent processing.", level="info")
-                        return False
-
-                    title_anchor = row.select_one('a[href^="/view/"]:not(.comments)')
-                    if not title_anchor:
-                        continue
-
-                    title = title_anchor.text.strip()
-                    magnet_tag = row.select_one('a[href^="magnet:"]')
-                    if not magnet_tag:
-                        continue
-                    magnet = magnet_tag['href']
-
-                    try:
-                        # Debug info printed to console (not in GUI log)
-                        debug_log(f"Parsing title: {title}")
-                        parsed = self.parse_title(title)
-                        debug_log(f"Parsed title: {parsed}")
-                        
-                        if self.is_valid_episode(show, season, episode, parsed):
-                            self.log(f"    Match Found: {title}", level="success")
-                            webbrowser.open(magnet)
-
-                            if parsed.get('is_batch'):
-                                batch_episodes = self.get_batch_episodes(parsed)
-                                for be_season, be_episode in batch_episodes:
-                                    if show['needed_episodes'].get(be_season) and be_episode in show['needed_episodes'][be_season]:
-                                        show['downloaded_episodes'].setdefault(be_season, set()).add(be_episode)
-                                        show['needed_episodes'][be_season].discard(be_episode)
-                                        if not show['needed_episodes'][be_season]:
-                                            show['needed_episodes'].pop(be_season, None)
-                                self.log(f"     Batch Episodes Downloaded: {batch_episodes}", level="success")
-                            else:
-                                show['downloaded_episodes'].setdefault(season, set()).add(episode)
-                            self.save_state()
-                            return True
-
-                    except Exception as e:
-                        debug_log(f"Error processing torrent for title '{title}': {str(e)}")
-                        continue
-
-            except Exception as e:
-                debug_log(f"Search query failed for query '{query}': {str(e)}")
-
-        return False
-
-    def calculate_absolute_episode(self, show_name: str, season: int, episode: int) -> int:
-        eps_data = self.known_shows.get(show_name, {}).get('episodes_per_season', 12)
-        if isinstance(eps_data, list):
-            total = sum(eps_data[:season-1])
-            return total + episode
-        return (season - 1) * eps_data + episode
-
-    def load_known_shows(self) -> Dict:
-        try:
-            with open(self.config['known_shows_file']) as f:
-                return json.load(f)
-        except FileNotFoundError:
-            return {}
-        except Exception as e:
-            self.log(f"Error loading known shows: {str(e)}", "error")
-            return {}
+        for line in self.engine.scan_summary():
+            self.log(line, level="info")
+        self.set_status("Scan stopped" if self.engine.stop_scan_event.is_set() else "Scan complete")
 
     def save_known_shows(self, updated_shows):
-        self.known_shows = updated_shows
         try:
-            with open(self.config['known_shows_file'], 'w') as f:
-                json.dump(self.known_shows, f, indent=2)
-            self.recalculate_needed_for_all_shows()
+            self.engine.update_known_shows(updated_shows)
             messagebox.showinfo("Success", "Known shows updated successfully.")
         except Exception as e:
             messagebox.showerror("Error", f"Failed to save known shows: {str(e)}")
 
     def edit_known_shows_gui(self):
-        dialog = EditKnownShowsDialog(self.root, self.known_shows, self.save_known_shows)
+        dialog = EditKnownShowsDialog(self.root, self.engine.known_shows, self.save_known_shows)
         self.root.wait_window(dialog)
 
-    def load_state(self):
-        try:
-            if not os.path.exists('tracked_shows.json') or os.path.getsize('tracked_shows.json') == 0:
-                self.tracked_shows = []
-                self.log("No tracked shows found. Starting fresh.", "info")
-                return
-
-            with open('tracked_shows.json') as f:
-                data = json.load(f)
-                for show in data:
-                    downloaded = {}
-                    for season, episode in show.get('downloaded_episodes', []):
-                        downloaded.setdefault(season, []).append(episode)
-                    show['downloaded_episodes'] = {int(season): set(episodes) for season, episodes in downloaded.items()}
-
-                    needed = {}
-                    for season, episode in show.get('needed_episodes', []):
-                        needed.setdefault(season, []).append(episode)
-                    show['needed_episodes'] = {int(season): set(episodes) for season, episodes in needed.items()}
-
-                    show.setdefault('last_checked', None)
-                    show.setdefault('quality', '1080p')
-                    show.setdefault('names', [])
-                    show.setdefault('start_season', 1)
-                    show.setdefault('start_episode', 1)
-                    show.setdefault('end_season', 1)
-                    show.setdefault('end_episode', 12)
-
-                self.tracked_shows = data
-                self.log("Loaded tracked shows successfully.", "info")
-        except FileNotFoundError:
-            self.tracked_shows = []
-            self.log("No tracked shows file found. Starting fresh.", "info")
-        except json.decoder.JSONDecodeError as e:
-            self.tracked_shows = []
-            self.log("Error loading state: Invalid JSON format. Starting fresh.", "error")
-        except Exception as e:
-            self.tracked_shows = []
-            self.log(f"Error loading state: {str(e)}", "error")
-
-    def save_state(self):
-        data = []
-        for show in self.tracked_shows:
-            show_copy = show.copy()
-
-            downloaded = []
-            for season, episodes in show_copy.get('downloaded_episodes', {}).items():
-                for episode in episodes:
-                    downloaded.append([season, episode])
-            show_copy['downloaded_episodes'] = sorted(downloaded, key=lambda x: (x[0], x[1]))
-
-            needed = []
-            for season, episodes in show_copy.get('needed_episodes', {}).items():
-                for episode in episodes:
-                    needed.append([season, episode])
-            show_copy['needed_episodes'] = sorted(needed, key=lambda x: (x[0], x[1]))
-
-            data.append(show_copy)
-
-        try:
-            with open('tracked_shows.json', 'w') as f:
-                json.dump(data, f, indent=2)
-            self.log("State saved successfully.", "info")
-        except Exception as e:
-            self.log(f"Error saving state: {str(e)}", "error")
-
-    def recalculate_needed_for_all_shows(self):
-        for show in self.tracked_shows:
-            self.recalculate_needed_for_show(show)
-        self.save_state()
-
-    def recalculate_needed_for_show(self, show: Dict):
-        try:
-            needed = {}
-            show_name = show['names'][0]
-            start_season = show['start_season']
-            end_season = show['end_season']
-            start_episode = show['start_episode']
-            end_episode = show['end_episode']
-
-            for season in range(start_season, end_season + 1):
-                if show_name in self.known_shows:
-                    eps_data = self.known_shows[show_name].get('episodes_per_season', 12)
-                    if isinstance(eps_data, list):
-                        eps_per_season = eps_data[season - 1] if season - 1 < len(eps_data) else 12
-                    else:
-                        eps_per_season = eps_data
-
-                    current_start_ep = start_episode if season == start_season else 1
-                    current_end_ep = end_episode if season == end_season else eps_per_season
-                    current_end_ep = min(current_end_ep, eps_per_season)
-                else:
-                    if start_season == end_season:
-                        current_start_ep = start_episode
-                        current_end_ep = end_episode
-                    else:
-                        if season == start_season:
-                            current_start_ep = start_episode
-                            current_end_ep = show['end_episode']
-                        elif season == end_season:
-                            current_start_ep = 1
-                            current_end_ep = end_episode
-                        else:
-                            current_start_ep = 1
-                            current_end_ep = show['end_episode']
-
-                current_start_ep = max(1, current_start_ep)
-                current_end_ep = max(current_start_ep, current_end_ep)
-
-                for ep in range(current_start_ep, current_end_ep + 1):
-                    if show['downloaded_episodes'].get(season) and ep in show['downloaded_episodes'][season]:
-                        continue
-                    needed.setdefault(season, set()).add(ep)
-
-            show['needed_episodes'] = needed
-
-        except Exception as e:
-            self.log(f"Error recalculating episodes for {show['names'][0]}: {str(e)}", "error")
-
-    def get_batch_episodes(self, parsed: Dict) -> Set[Tuple[int, int]]:
-        season = parsed['season']
-        show_name = parsed.get('show', "")
-        eps_data = self.known_shows.get(show_name, {}).get('episodes_per_season', 12)
-        if isinstance(eps_data, list):
-            eps_per_season = eps_data[season-1] if season-1 < len(eps_data) else 12
-        else:
-            eps_per_season = eps_data
-        return {(season, ep) for ep in range(1, eps_per_season + 1)}
-
-    def is_valid_episode(self, show: Dict, target_season: int, target_episode: int, parsed: Dict) -> bool:
-        norm_parsed = normalize_show_name(parsed.get('show', ""))
-        if not any(normalize_show_name(name) == norm_parsed for name in show['names']):
-            return False
-
-        if parsed.get('quality') != show.get('quality'):
-            return False
-
-        if parsed.get('is_batch'):
-            batch_episodes = self.get_batch_episodes(parsed)
-            return (target_season, target_episode) in batch_episodes
-        else:
-            return parsed.get('season') == target_season and parsed.get('episode') == target_episode
-
-    def parse_title(self, title: str) -> Dict:
-        """
-        Parse a torrent title using OpenAI's API.
-        Under the hood debug logging is sent to the console.
-        """
-        client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        system_prompt = f"""Extract anime metadata as JSON with:
-- show: normalized title
-- season: number
-- episode: number (null if batch)
-- is_batch: boolean
-- quality: string
-- batch_episodes: array of episode numbers (if batch)
-Rules for {json.dumps(self.known_shows, indent=2)}
-If season markers are missing, derive season based on episode counts."""
-        try:
-            debug_log(f"Parsing title: {title}")
-            response = client.chat.completions.create(
-                model=self.config['openai_model'],
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": title}
-                ],
-                temperature=0.1
-            )
-            raw_response = response.choices[0].message.content
-            debug_log(f"Raw response for title '{title}': {raw_response}")
-            # Remove markdown formatting if present
-            if raw_response.startswith("```json"):
-                raw_response = raw_response.split("```json", 1)[1]
-                if "```" in raw_response:
-                    raw_response = raw_response.split("```", 1)[0]
-                raw_response = raw_response.strip()
-            result = json.loads(raw_response)
-            result['season'] = int(result.get('season', 1))
-            if 'episode' in result and result['episode'] is not None:
-                result['episode'] = int(result['episode'])
-            return result
-        except Exception as e:
-            debug_log(f"Exception in parse_title for title '{title}': {str(e)}")
-            raise
-
     def edit_show(self, event):
         selection = self.listbox.curselection()
         if selection:
             selected_index = selection[0]
-            show_to_edit = self.tracked_shows[selected_index]
-            dialog = EditShowDialog(self.root, show_to_edit)
+            dialog = EditShowDialog(self.root, self.engine.tracked_shows[selected_index])
             self.root.wait_window(dialog)
             if dialog.result:
-                updated_show = {
-                    **dialog.result,
-                    'downloaded_episodes': show_to_edit['downloaded_episodes'],
-                    'needed_episodes': show_to_edit['needed_episodes'],
-                    'last_checked': show_to_edit['last_checked']
-                }
-                self.tracked_shows[selected_index] = updated_show
-                self.recalculate_needed_for_show(updated_show)
+                updated_show = self.engine.update_show(selected_index, dialog.result)
                 self.update_show_list()
-                self.save_state()
-                self.log(f"Edited show: {updated_show['names'][0]}", level="info")
+                if self.tree_show is not None and self.tree_show['id'] == updated_show['id']:
+                    self.update_episodes_tree(updated_show)
 
     def reset_show(self):
         selection = self.listbox.curselection()
@@ -868,24 +626,23 @@ If season markers are missing, derive season based on episode counts."""
             messagebox.showerror("Error", "No show selected to reset.")
             return
 
-        selected_index = selection[0]
-        show = self.tracked_shows[selected_index]
+        show = self.engine.tracked_shows[selection[0]]
         show_name = show['names'][0]
 
         if messagebox.askyesno("Confirm Reset", f"Are you sure you want to reset all data for '{show_name}'?"):
-            show['downloaded_episodes'].clear()
-            self.recalculate_needed_for_show(show)
+            self.engine.reset_show(show)
             self.update_episodes_tree(show)
             self.update_show_list()
-            self.save_state()
-            self.log(f"Show '{show_name}' has been reset.", level="info")
 
     def on_closing(self):
         if self.scanning:
             if messagebox.askokcancel("Quit", "A scan is in progress. Do you want to stop the scan and quit?"):
-                self.stop_scan_event.set()
+                self.engine.stop_scan()
+                self.engine.parse_cache.flush()
+                self.engine.flush_state()
                 self.root.destroy()
         else:
+            self.engine.close()
             self.root.destroy()
 
 if __name__ == "__main__":
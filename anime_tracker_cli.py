@@ -0,0 +1,134 @@
+"""
+Command-line front end for Anime Tracker Pro, for servers, cron jobs and containers.
+Uses the same tracked shows, known shows and caches as the GUI.
+
+    python anime_tracker_cli.py scan [--mode search|feed]
+    python anime_tracker_cli.py watch [--interval 3600] [--all]
+    python anime_tracker_cli.py status [--json]
+
+Matched magnets go to the sink chosen with --sink (default: print): browser, print,
+file:PATH or watch:DIR (a torrent client's watch directory). Log lines go to stderr.
+watch polls each show on its own adaptive interval (see PollScheduler) unless --all
+is given, in which case every show is scanned every --interval seconds.
+After each scan, per-stage timings and counters are written to metrics_file (JSON)
+and, when set, metrics_prometheus_file (Prometheus text format, e.g. for node_exporter).
+"""
+import sys
+import json
+import time
+import signal
+import argparse
+import threading
+from typing import Dict, List, Tuple
+
+from anime_tracker_engine import TrackerEngine, make_sink
+
+def print_log(lines: List[Tuple[str, str]]):
+    for message, level in lines:
+        prefix = "ERROR " if level == "error" else ""
+        print(f"{prefix}{message}", file=sys.stderr, flush=True)
+
+def load_config(path: str) -> Dict:
+    """Config overrides from a JSON object file, keyed like TrackerEngine.DEFAULT_CONFIG."""
+    with open(path) as f:
+        config = json.load(f)
+    if not isinstance(config, dict):
+        raise ValueError(f"{path} must contain a JSON object")
+    return config
+
+def run_once(engine: TrackerEngine, mode: str, due_only: bool = False):
+    engine.run_scan(mode, due_only)
+    for line in engine.scan_summary():
+        engine.log(line)
+
+def cmd_scan(engine: TrackerEngine, args, stop_requested: threading.Event) -> int:
+    run_once(engine, args.mode)
+    return 0
+
+def cmd_watch(engine: TrackerEngine, args, stop_requested: threading.Event) -> int:
+    adaptive = not args.all and (args.mode or engine.config['scan_mode']) == 'search'
+    while not stop_requested.is_set():
+        run_once(engine, args.mode, due_only=adaptive)
+        wait = args.interval
+        next_poll = engine.next_poll_time() if adaptive else None
+        if next_poll is not None:
+            wait = min(args.interval, max(engine.config['poll_tick_seconds'], next_poll - time.time()))
+        engine.log(f"Next check in {wait:.0f}s.")
+        if stop_requested.wait(wait):
+            break
+    return 0
+
+def cmd_status(engine: TrackerEngine, args, stop_requested: threading.Event) -> int:
+    rows = []
+    now = time.time()
+    with engine.state_lock:
+        for show in engine.tracked_shows:
+            next_needed = show['needed_episodes'].first()
+            rows.append({
+                'name': show['names'][0],
+                'quality': show['quality'],
+                'downloaded': len(show['downloaded_episodes']),
+                'needed': len(show['needed_episodes']),
+                'next_needed': f"S{next_needed[0]:02d}E{next_needed[1]:02d}" if next_needed else None,
+                'last_checked': show['last_checked'],
+                'next_poll': time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(engine.scheduler.next_due(show, now)))
+            })
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return 0
+    for row in rows:
+        print(f"{row['name']} ({row['quality']}): {row['downloaded']} downloaded, {row['needed']} needed"
+              f", next {row['next_needed'] or '-'}, last checked {row['last_checked'] or 'never'}"
+              f", next poll {row['next_poll']}")
+    return 0
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Anime Tracker Pro without the GUI.")
+    parser.add_argument('--config', help="JSON file of config overrides")
+    parser.add_argument('--sink', help="Where matched magnets go: browser, print, file:PATH or watch:DIR")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    scan = commands.add_parser('scan', help="Scan once and exit")
+    scan.add_argument('--mode', choices=['search', 'feed'], default=None)
+    scan.set_defaults(handler=cmd_scan)
+
+    watch = commands.add_parser('watch', help="Poll repeatedly until interrupted")
+    watch.add_argument('--interval', type=float, default=3600.0,
+                       help="Longest wait in seconds between checks (the fixed period with --all)")
+    watch.add_argument('--all', action='store_true', help="Scan every show each time instead of only due shows")
+    watch.add_argument('--mode', choices=['search', 'feed'], default=None)
+    watch.set_defaults(handler=cmd_watch)
+
+    status = commands.add_parser('status', help="Show tracked shows and their progress")
+    status.add_argument('--json', action='store_true', help="Print machine-readable JSON")
+    status.set_defaults(handler=cmd_status)
+    return parser
+
+def main(argv=None) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    config = load_config(args.config) if args.config else {}
+    if args.sink:
+        config['magnet_sink'] = args.sink
+    try:
+        sink = make_sink(config.get('magnet_sink', 'print'))
+    except ValueError as e:
+        parser.error(str(e))
+    engine = TrackerEngine(config, sink=sink, on_log=print_log)
+
+    # SIGINT/SIGTERM finish the current show's requests and save state instead of dying mid-write.
+    stop_requested = threading.Event()
+
+    def request_stop(signum, frame):
+        stop_requested.set()
+        engine.stop_scan()
+    signal.signal(signal.SIGINT, request_stop)
+    signal.signal(signal.SIGTERM, request_stop)
+
+    try:
+        return args.handler(engine, args, stop_requested)
+    finally:
+        engine.close()
+
+if __name__ == "__main__":
+    sys.exit(main())
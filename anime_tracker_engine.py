@@ -0,0 +1,3047 @@
+"""
+Scanning engine for Anime Tracker Pro: tracked-show state, known shows, title parsing,
+nyaa searches and magnet delivery, with no GUI dependency. Used by the Tk app
+(anime_tracker.py) and the command line (anime_tracker_cli.py).
+"""
+import os
+import sys
+import copy
+import json
+import time
+import uuid
+import tempfile
+import random
+import hashlib
+import math
+import sqlite3
+import webbrowser
+import requests
+import threading
+import logging
+import logging.handlers
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from urllib.parse import urlparse, quote
+from email.utils import parsedate_to_datetime
+from html.parser import HTMLParser
+from typing import List, Dict, Set, Tuple, Optional, TypedDict
+import re
+import bisect
+import functools
+import heapq
+import xml.etree.ElementTree as ET
+from datetime import datetime
+from openai import OpenAI, RateLimitError, APIConnectionError, InternalServerError
+from requests.adapters import HTTPAdapter
+
+# --- Helper Functions ---
+logger = logging.getLogger("anime_tracker")
+
+def configure_logging(path: str, level: str = "DEBUG", max_bytes: int = 5 * 1024 * 1024, backups: int = 3):
+    """Send the tracker's log records to a rotating file. Safe to call more than once."""
+    if any(isinstance(handler, logging.handlers.RotatingFileHandler) for handler in logger.handlers):
+        return
+    handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8")
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s [%(threadName)s] %(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(getattr(logging, level.upper(), logging.DEBUG))
+
+def debug_log(message: str):
+    """Record a detailed debug message in the log file."""
+    logger.debug(message)
+
+@functools.lru_cache(maxsize=65536)
+def normalize_show_name(name: str) -> str:
+    """
+    Normalize a show name by lowercasing and removing punctuation and extra whitespace.
+    """
+    name = name.lower().strip()
+    name = re.sub(r"[’'\",:;\-]", "", name)
+    name = re.sub(r"\s+", " ", name)
+    return name
+
+def current_timestamp() -> str:
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+def connect_sqlite(path: str) -> sqlite3.Connection:
+    """Open a SQLite database shared between threads, in WAL mode for cheap commits."""
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+class NyaaResultParser(HTMLParser):
+    """
+    Single-pass extractor for the rows of a nyaa torrent-list table.
+    Cells are identified by position: category, name, links, size, date, seeders.
+    """
+    ROW_CLASSES = {'danger', 'default', 'success'}
+    SIZE_CELL, DATE_CELL, SEEDERS_CELL = 3, 4, 5
+
+    def __init__(self):
+        super().__init__()
+        self.rows: List[Dict] = []
+        self.row: Optional[Dict] = None
+        self.cell = -1
+        self.cell_text: List[str] = []
+        self.title_text: Optional[List[str]] = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'tr':
+            classes = set((dict(attrs).get('class') or "").split())
+            self.row = {} if classes & self.ROW_CLASSES else None
+            self.cell = -1
+        elif self.row is None:
+            return
+        elif tag == 'td':
+            self.cell += 1
+            self.cell_text = []
+            if self.cell == self.DATE_CELL:
+                timestamp = dict(attrs).get('data-timestamp')
+                if timestamp and timestamp.isdigit():
+                    self.row['date'] = int(timestamp)
+        elif tag == 'a':
+            attributes = dict(attrs)
+            href = attributes.get('href') or ""
+            if href.startswith('magnet:'):
+                self.row.setdefault('magnet', href)
+            elif href.startswith('/view/') and 'comments' not in (attributes.get('class') or "") and 'title' not in self.row:
+                view_id = href[len('/view/'):].split('#', 1)[0]
+                self.row['view_id'] = int(view_id) if view_id.isdigit() else None
+                self.title_text = []
+
+    def handle_endtag(self, tag):
+        if self.row is None:
+            return
+        if tag == 'a' and self.title_text is not None:
+            self.row['title'] = "".join(self.title_text).strip()
+            self.title_text = None
+        elif tag == 'td':
+            text = "".join(self.cell_text).strip()
+            if self.cell == self.SIZE_CELL:
+                self.row['size'] = text
+            elif self.cell == self.DATE_CELL:
+                self.row.setdefault('date', text)
+            elif self.cell == self.SEEDERS_CELL:
+                self.row['seeders'] = int(text) if text.isdigit() else 0
+        elif tag == 'tr':
+            if self.row.get('title') and self.row.get('magnet'):
+                self.rows.append(self.row)
+            self.row = None
+
+    def handle_data(self, data):
+        if self.row is None:
+            return
+        self.cell_text.append(data)
+        if self.title_text is not None:
+            self.title_text.append(data)
+
+def extract_result_rows(html: str) -> List[Dict]:
+    """
+    Extract result rows from a nyaa search results page as
+    {title, magnet, view_id, size, date, seeders} records, in page order.
+    Only the torrent-list table is fed to the parser.
+    """
+    start = html.find('torrent-list')
+    if start == -1:
+        return []
+    end = html.find('</table>', start)
+    parser = NyaaResultParser()
+    parser.feed(html[html.rfind('<', 0, start):end if end != -1 else len(html)])
+    parser.close()
+    return parser.rows
+
+# --- Concurrency Limits ---
+class RequestLimiter:
+    """
+    Caps the number of in-flight upstream requests, both overall and per host,
+    across all scan workers.
+    """
+    def __init__(self, max_concurrent: int, per_host: int):
+        self.global_slots = threading.BoundedSemaphore(max(1, max_concurrent))
+        self.per_host = max(1, per_host)
+        self.host_slots: Dict[str, threading.BoundedSemaphore] = {}
+        self.lock = threading.Lock()
+
+    def host_semaphore(self, host: str) -> threading.BoundedSemaphore:
+        with self.lock:
+            if host not in self.host_slots:
+                self.host_slots[host] = threading.BoundedSemaphore(self.per_host)
+            return self.host_slots[host]
+
+    @contextmanager
+    def limit(self, url: str):
+        host_slot = self.host_semaphore(urlparse(url).netloc or url)
+        with host_slot:
+            with self.global_slots:
+                yield
+
+# --- Rate Limiting ---
+class TokenBucket:
+    """
+    Thread-safe token bucket that adapts its refill rate to upstream throttling:
+    the rate is halved on every 429 and creeps back towards the configured rate
+    (additive increase) as requests succeed.
+    """
+    def __init__(self, name: str, rate: float, burst: float):
+        self.name = name
+        self.max_rate = rate
+        self.min_rate = rate / 16
+        self.rate = rate
+        self.capacity = max(1.0, burst)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+        self.waited = 0.0
+        self.throttled = 0
+
+    def acquire(self, cost: float = 1.0, stop_event: Optional[threading.Event] = None) -> bool:
+        """Block until cost tokens are available. Returns False if stop_event was set while waiting."""
+        cost = min(cost, self.capacity)
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= cost:
+                    self.tokens -= cost
+                    return True
+                delay = (cost - self.tokens) / self.rate
+                self.waited += delay
+            if stop_event is not None:
+                if stop_event.wait(delay):
+                    return False
+            else:
+                time.sleep(delay)
+
+    def penalize(self, retry_after: Optional[float] = None):
+        with self.lock:
+            self._refill()
+            self.throttled += 1
+            self.rate = max(self.min_rate, self.rate / 2)
+            # Draining the bucket (below zero when Retry-After is given) pauses every worker.
+            self.tokens = min(0.0, -self.rate * (retry_after or 0.0))
+
+    def reward(self):
+        with self.lock:
+            if self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+    def stats_summary(self) -> str:
+        with self.lock:
+            return (f"Rate limit {self.name}: {self.rate:.2f}/{self.max_rate:.2f} per s, "
+                    f"{self.throttled} throttled responses, {self.waited:.1f}s spent waiting")
+
+    def reset_stats(self):
+        with self.lock:
+            self.waited = 0.0
+            self.throttled = 0
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+class RateLimiterRegistry:
+    """
+    One TokenBucket per upstream, created on first use from the 'rate_limits' config.
+    Keys are looked up exactly, then by their prefix before ':' (e.g. 'openai:gpt-4o-mini'
+    falls back to 'openai'), then 'default'.
+    """
+    def __init__(self, limits: Dict[str, Dict]):
+        self.limits = limits
+        self.buckets: Dict[str, TokenBucket] = {}
+        self.lock = threading.Lock()
+
+    def bucket(self, key: str) -> TokenBucket:
+        with self.lock:
+            if key not in self.buckets:
+                settings = self.limits.get(key) or self.limits.get(key.split(':', 1)[0]) or self.limits['default']
+                self.buckets[key] = TokenBucket(key, settings['rate'], settings['burst'])
+            return self.buckets[key]
+
+    def reset_stats(self):
+        with self.lock:
+            buckets = list(self.buckets.values())
+        for bucket in buckets:
+            bucket.reset_stats()
+
+    def stats_summary(self) -> List[str]:
+        with self.lock:
+            buckets = sorted(self.buckets.values(), key=lambda bucket: bucket.name)
+        return [bucket.stats_summary() for bucket in buckets]
+
+# --- HTTP Client ---
+class HttpClient:
+    """
+    Shared, connection-pooled HTTP session for upstream requests.
+    Retries connection errors, timeouts, 429 and 5xx responses with exponential backoff
+    and jitter (honouring Retry-After), and keeps per-host latency and error counters.
+    """
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+    def __init__(self, pool_size: int = 10, timeout: float = 10, max_retries: int = 3,
+                 backoff_base: float = 1.0, backoff_max: float = 30.0,
+                 limiter: Optional[RequestLimiter] = None, rate_limits: Optional[RateLimiterRegistry] = None,
+                 stop_event: Optional[threading.Event] = None):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.limiter = limiter
+        self.rate_limits = rate_limits
+        self.stop_event = stop_event or threading.Event()
+        self.lock = threading.Lock()
+        self.host_stats: Dict[str, Dict[str, float]] = {}
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        host = urlparse(url).netloc
+        kwargs.setdefault('timeout', self.timeout)
+        bucket = self.rate_limits.bucket(host) if self.rate_limits else None
+        attempt = 0
+        while True:
+            if bucket and not bucket.acquire(stop_event=self.stop_event):
+                raise requests.ConnectionError(f"Request to {host} abandoned: scan stopped")
+            start = time.monotonic()
+            try:
+                if self.limiter:
+                    with self.limiter.limit(url):
+                        response = self.session.get(url, **kwargs)
+                else:
+                    response = self.session.get(url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self._record(host, time.monotonic() - start, error=True)
+                if attempt >= self.max_retries:
+                    raise
+                delay = self._backoff(attempt)
+                debug_log(f"Request to {host} failed ({str(e)}), retrying in {delay:.1f}s")
+            else:
+                failed = response.status_code in self.RETRY_STATUSES
+                self._record(host, time.monotonic() - start, error=failed)
+                delay = self._retry_after(response) if failed else None
+                if bucket:
+                    if response.status_code == 429:
+                        bucket.penalize(delay)
+                    elif not failed:
+                        bucket.reward()
+                if not failed:
+                    return response
+                if attempt >= self.max_retries:
+                    response.raise_for_status()
+                if delay is None:
+                    delay = self._backoff(attempt)
+                debug_log(f"Request to {host} returned {response.status_code}, retrying in {delay:.1f}s")
+
+            attempt += 1
+            with self.lock:
+                self.host_stats[host]['retries'] += 1
+            if self.stop_event.wait(delay):
+                raise requests.ConnectionError(f"Request to {host} abandoned: scan stopped")
+
+    def reset_stats(self):
+        with self.lock:
+            self.host_stats = {}
+
+    def host_stats_snapshot(self) -> Dict[str, Dict[str, float]]:
+        with self.lock:
+            return {host: dict(values) for host, values in self.host_stats.items()}
+
+    def stats_summary(self) -> List[str]:
+        stats = self.host_stats_snapshot()
+        lines = []
+        for host, values in sorted(stats.items()):
+            avg_ms = 1000.0 * values['latency_total'] / values['requests'] if values['requests'] else 0.0
+            lines.append(
+                f"HTTP {host}: {int(values['requests'])} requests, {int(values['errors'])} errors, "
+                f"{int(values['retries'])} retries, avg {avg_ms:.0f} ms, max {1000.0 * values['latency_max']:.0f} ms"
+            )
+        return lines
+
+    def close(self):
+        self.session.close()
+
+    def _record(self, host: str, latency: float, error: bool):
+        with self.lock:
+            stats = self.host_stats.setdefault(
+                host, {'requests': 0, 'errors': 0, 'retries': 0, 'latency_total': 0.0, 'latency_max': 0.0}
+            )
+            stats['requests'] += 1
+            stats['latency_total'] += latency
+            stats['latency_max'] = max(stats['latency_max'], latency)
+            if error:
+                stats['errors'] += 1
+
+    def _backoff(self, attempt: int) -> float:
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        return delay * random.uniform(0.5, 1.0)
+
+    def _retry_after(self, response: requests.Response) -> Optional[float]:
+        value = response.headers.get('Retry-After')
+        if not value:
+            return None
+        try:
+            delay = float(value)
+        except ValueError:
+            try:
+                retry_at = parsedate_to_datetime(value)
+                delay = (retry_at - datetime.now(retry_at.tzinfo)).total_seconds()
+            except (TypeError, ValueError):
+                return None
+        return min(self.backoff_max, max(0.0, delay))
+
+# --- Episode State ---
+def _trailing_zeros(bits: int) -> int:
+    return (bits & -bits).bit_length() - 1
+
+class EpisodeSet:
+    """
+    Set of (season, episode) pairs stored as one integer bitset per season
+    (bit n set means episode n is present). Serializes to compact range strings,
+    e.g. {"1": "1-12", "2": "1-3,5"}, and still loads the legacy [[season, episode], ...] lists.
+    """
+    __slots__ = ('seasons',)
+
+    def __init__(self, pairs=()):
+        self.seasons: Dict[int, int] = {}
+        for season, episode in pairs:
+            self.add(season, episode)
+
+    def __contains__(self, item) -> bool:
+        season, episode = item
+        return episode >= 0 and (self.seasons.get(season, 0) >> episode) & 1 == 1
+
+    def __iter__(self):
+        for season in sorted(self.seasons):
+            for episode in self.season_episodes(season):
+                yield season, episode
+
+    def __len__(self) -> int:
+        return sum(bin(bits).count('1') for bits in self.seasons.values())
+
+    def __bool__(self) -> bool:
+        return bool(self.seasons)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, EpisodeSet) and self.seasons == other.seasons
+
+    def __repr__(self) -> str:
+        return f"EpisodeSet({self.to_json()})"
+
+    def add(self, season: int, episode: int):
+        self.seasons[season] = self.seasons.get(season, 0) | (1 << episode)
+
+    def discard(self, season: int, episode: int):
+        bits = self.seasons.get(season, 0) & ~(1 << episode)
+        if bits:
+            self.seasons[season] = bits
+        else:
+            self.seasons.pop(season, None)
+
+    def add_range(self, season: int, first: int, last: int):
+        """Add episodes first..last (inclusive) of a season in one operation."""
+        if last < first:
+            return
+        mask = ((1 << (last - first + 1)) - 1) << first
+        self.seasons[season] = self.seasons.get(season, 0) | mask
+
+    def count_range(self, season: int, first: int, last: int) -> int:
+        """Number of episodes first..last (inclusive) of a season in the set."""
+        if last < first:
+            return 0
+        mask = ((1 << (last - first + 1)) - 1) << first
+        return bin(self.seasons.get(season, 0) & mask).count('1')
+
+    def difference_update(self, other: 'EpisodeSet'):
+        for season, bits in other.seasons.items():
+            if season in self.seasons:
+                remaining = self.seasons[season] & ~bits
+                if remaining:
+                    self.seasons[season] = remaining
+                else:
+                    del self.seasons[season]
+
+    def clear(self):
+        self.seasons.clear()
+
+    def copy(self) -> 'EpisodeSet':
+        clone = EpisodeSet()
+        clone.seasons = dict(self.seasons)
+        return clone
+
+    def first(self) -> Optional[Tuple[int, int]]:
+        """The lowest (season, episode) pair, or None when empty."""
+        if not self.seasons:
+            return None
+        season = min(self.seasons)
+        return season, _trailing_zeros(self.seasons[season])
+
+    def season_episodes(self, season: int) -> List[int]:
+        return [episode for first, last in self.season_ranges(season) for episode in range(first, last + 1)]
+
+    def season_ranges(self, season: int) -> List[Tuple[int, int]]:
+        ranges = []
+        bits = self.seasons.get(season, 0)
+        while bits:
+            first = _trailing_zeros(bits)
+            run = _trailing_zeros(~(bits >> first))
+            ranges.append((first, first + run - 1))
+            bits &= ~(((1 << run) - 1) << first)
+        return ranges
+
+    def to_json(self) -> Dict[str, str]:
+        return {
+            str(season): ",".join(str(first) if first == last else f"{first}-{last}" for first, last in self.season_ranges(season))
+            for season in sorted(self.seasons)
+        }
+
+    @classmethod
+    def from_json(cls, data) -> 'EpisodeSet':
+        episodes = cls()
+        if isinstance(data, dict):
+            for season, ranges in data.items():
+                for part in str(ranges).split(","):
+                    if not part.strip():
+                        continue
+                    first, _, last = part.partition("-")
+                    episodes.add_range(int(season), int(first), int(last or first))
+        else:
+            for season, episode in data or []:
+                episodes.add(int(season), int(episode))
+        return episodes
+
+# --- State Storage ---
+SHOW_EPISODE_FIELDS = ('downloaded_episodes', 'needed_episodes')
+
+class JsonStateStore:
+    """Tracked shows stored as one JSON document (the original tracked_shows.json format)."""
+    def __init__(self, path: str):
+        self.path = path
+
+    def load(self) -> List[Dict]:
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            return []
+        with open(self.path) as f:
+            data = json.load(f)
+        for show in data:
+            for field in SHOW_EPISODE_FIELDS:
+                show[field] = EpisodeSet.from_json(show.get(field))
+        return data
+
+    def save(self, shows: List[Dict], dirty_ids: Optional[Set[str]] = None):
+        """Rewrite the whole document (dirty_ids is ignored) via a temp file and os.replace."""
+        data = []
+        for show in shows:
+            show_copy = show.copy()
+            for field in SHOW_EPISODE_FIELDS:
+                show_copy[field] = show[field].to_json()
+            data.append(show_copy)
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, temp_path = tempfile.mkstemp(prefix=".tracked_shows.", suffix=".tmp", dir=directory)
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(data, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def close(self):
+        pass
+
+class SqliteStateStore:
+    """
+    Tracked shows stored in SQLite (WAL mode) with one row per show and one row per
+    episode. save() diffs each show against what was last persisted and writes only the
+    changed rows, all in a single transaction, so a crash can't leave partial state.
+    """
+    def __init__(self, path: str):
+        self.lock = threading.Lock()
+        # show id -> (metadata JSON, {field: EpisodeSet}) as last loaded or saved
+        self.snapshots: Dict[str, Tuple[str, Dict[str, EpisodeSet]]] = {}
+        self.conn = connect_sqlite(path)
+        self.conn.executescript(
+            """CREATE TABLE IF NOT EXISTS shows (
+                id TEXT PRIMARY KEY,
+                position INTEGER NOT NULL,
+                data TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS episodes (
+                show_id TEXT NOT NULL,
+                season INTEGER NOT NULL,
+                episode INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                PRIMARY KEY (show_id, season, episode, status)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );"""
+        )
+        self.conn.commit()
+
+    @staticmethod
+    def show_metadata(show: Dict, position: int) -> str:
+        data = {key: value for key, value in show.items() if key not in SHOW_EPISODE_FIELDS}
+        data['position'] = position
+        return json.dumps(data, sort_keys=True)
+
+    def load(self) -> List[Dict]:
+        with self.lock:
+            shows = {}
+            for show_id, data in self.conn.execute("SELECT id, data FROM shows ORDER BY position"):
+                show = json.loads(data)
+                show.pop('position', None)
+                for field in SHOW_EPISODE_FIELDS:
+                    show[field] = EpisodeSet()
+                shows[show_id] = show
+            for show_id, season, episode, status in self.conn.execute("SELECT show_id, season, episode, status FROM episodes"):
+                if show_id in shows:
+                    shows[show_id][f"{status}_episodes"].add(season, episode)
+
+            self.snapshots = {}
+            for position, (show_id, show) in enumerate(shows.items()):
+                self.snapshots[show_id] = (
+                    self.show_metadata(show, position),
+                    {field: show[field].copy() for field in SHOW_EPISODE_FIELDS}
+                )
+            return list(shows.values())
+
+    def save(self, shows: List[Dict], dirty_ids: Optional[Set[str]] = None):
+        """Persist changes; with dirty_ids, shows outside that set are assumed unchanged."""
+        with self.lock:
+            snapshots = {}
+            with self.conn:
+                for position, show in enumerate(shows):
+                    show_id = show['id']
+                    if dirty_ids is not None and show_id not in dirty_ids and show_id in self.snapshots:
+                        snapshots[show_id] = self._keep_position(show_id, position)
+                        continue
+                    metadata = self.show_metadata(show, position)
+                    old_metadata, old_episodes = self.snapshots.get(show_id, (None, {}))
+                    if metadata != old_metadata:
+                        self.conn.execute(
+                            "INSERT OR REPLACE INTO shows (id, position, data) VALUES (?, ?, ?)",
+                            (show_id, position, metadata)
+                        )
+                    for field in SHOW_EPISODE_FIELDS:
+                        self._write_episode_changes(show_id, field, old_episodes.get(field, EpisodeSet()), show[field])
+                    snapshots[show_id] = (metadata, {field: show[field].copy() for field in SHOW_EPISODE_FIELDS})
+
+                for show_id in set(self.snapshots) - set(snapshots):
+                    self.conn.execute("DELETE FROM episodes WHERE show_id = ?", (show_id,))
+                    self.conn.execute("DELETE FROM shows WHERE id = ?", (show_id,))
+            self.snapshots = snapshots
+
+    def _keep_position(self, show_id: str, position: int) -> Tuple[str, Dict[str, EpisodeSet]]:
+        """Snapshot of an unchanged show, updating its stored position if the show order changed."""
+        metadata, episodes = self.snapshots[show_id]
+        data = json.loads(metadata)
+        if data['position'] == position:
+            return metadata, episodes
+        data['position'] = position
+        metadata = json.dumps(data, sort_keys=True)
+        self.conn.execute("UPDATE shows SET position = ?, data = ? WHERE id = ?", (position, metadata, show_id))
+        return metadata, episodes
+
+    def _write_episode_changes(self, show_id: str, field: str, old: EpisodeSet, new: EpisodeSet):
+        if old == new:
+            return
+        status = field.replace('_episodes', '')
+        removed = old.copy()
+        removed.difference_update(new)
+        added = new.copy()
+        added.difference_update(old)
+        if removed:
+            self.conn.executemany(
+                "DELETE FROM episodes WHERE show_id = ? AND season = ? AND episode = ? AND status = ?",
+                [(show_id, season, episode, status) for season, episode in removed]
+            )
+        if added:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO episodes (show_id, season, episode, status) VALUES (?, ?, ?, ?)",
+                [(show_id, season, episode, status) for season, episode in added]
+            )
+
+    def import_json(self, json_path: str) -> int:
+        """
+        One-time import of an existing tracked_shows.json. Returns the number of shows
+        imported (0 if the import already ran or there was nothing to import).
+        """
+        with self.lock:
+            if self.conn.execute("SELECT value FROM meta WHERE key = 'json_imported'").fetchone():
+                return 0
+            has_shows = self.conn.execute("SELECT 1 FROM shows LIMIT 1").fetchone()
+        shows = [] if has_shows else JsonStateStore(json_path).load()
+        for show in shows:
+            show.setdefault('id', uuid.uuid4().hex)
+        if shows:
+            self.save(shows)
+        with self.lock:
+            with self.conn:
+                self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('json_imported', ?)", (current_timestamp(),))
+        return len(shows)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+class StatePersister:
+    """
+    Coalesces state saves. Callers mark shows dirty; a debounce timer (or an explicit
+    flush, e.g. at scan end) then writes all pending changes in one store.save call.
+    """
+    def __init__(self, store, get_shows, state_lock, delay: float = 2.0, on_error=None, on_saved=None):
+        self.store = store
+        self.get_shows = get_shows
+        self.state_lock = state_lock
+        self.delay = delay
+        self.on_error = on_error
+        self.on_saved = on_saved
+        self.lock = threading.Lock()
+        self.dirty_ids: Set[str] = set()
+        self.all_dirty = False
+        self.timer: Optional[threading.Timer] = None
+
+    def mark_dirty(self, show_id: Optional[str] = None):
+        """Mark one show (or, with no id, every show) as needing a save."""
+        with self.lock:
+            if show_id is None:
+                self.all_dirty = True
+            else:
+                self.dirty_ids.add(show_id)
+            if self.timer is None:
+                self.timer = threading.Timer(self.delay, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def flush(self):
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            if not (self.all_dirty or self.dirty_ids):
+                return
+            dirty_ids = None if self.all_dirty else set(self.dirty_ids)
+            self.all_dirty = False
+            self.dirty_ids.clear()
+
+        try:
+            started = time.perf_counter()
+            with self.state_lock:
+                self.store.save(self.get_shows(), dirty_ids)
+            debug_log(f"State saved ({'all' if dirty_ids is None else len(dirty_ids)} shows changed)")
+            if self.on_saved:
+                self.on_saved(time.perf_counter() - started)
+        except Exception as e:
+            # Keep the changes pending so the next flush retries them.
+            with self.lock:
+                if dirty_ids is None:
+                    self.all_dirty = True
+                else:
+                    self.dirty_ids |= dirty_ids
+            if self.on_error:
+                self.on_error(e)
+
+# --- Known Shows Catalog ---
+class KnownShows:
+    """
+    Compiled view of known_shows.json, rebuilt whenever it is loaded or saved.
+    Names are matched after normalization, and each show's episodes_per_season (an int
+    or a per-season list; seasons past the list have DEFAULT_EPISODES) is kept as prefix
+    sums so season lengths and absolute <-> (season, episode) conversions don't rescan it.
+    """
+    DEFAULT_EPISODES = 12
+
+    def __init__(self, data: Dict):
+        self.data = data
+        # normalized name -> (original name, uniform count or None, per-season counts, prefix sums)
+        self.entries: Dict[str, Tuple[str, Optional[int], List[int], List[int]]] = {}
+        # word -> original names containing it, for matching names inside release titles
+        self.word_index: Dict[str, Set[str]] = {}
+        for name, entry in data.items():
+            for word in self.match_key(name).split():
+                self.word_index.setdefault(word, set()).add(name)
+            eps_data = entry.get('episodes_per_season', self.DEFAULT_EPISODES)
+            if isinstance(eps_data, list):
+                counts = [int(count) for count in eps_data]
+                prefix = [0]
+                for count in counts:
+                    prefix.append(prefix[-1] + count)
+                self.entries[normalize_show_name(name)] = (name, None, counts, prefix)
+            else:
+                self.entries[normalize_show_name(name)] = (name, int(eps_data), [], [0])
+
+    def __contains__(self, name: str) -> bool:
+        return normalize_show_name(name or "") in self.entries
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def names(self) -> List[str]:
+        return [entry[0] for entry in self.entries.values()]
+
+    @staticmethod
+    def match_key(text: str) -> str:
+        """Normalized name with all punctuation turned into word breaks."""
+        return re.sub(r"[^\w]+", " ", normalize_show_name(text)).strip()
+
+    def names_in_title(self, title: str) -> List[str]:
+        """Known show names that appear as whole words inside a release title."""
+        title_key = f" {self.match_key(title)} "
+        candidates = set()
+        for word in set(title_key.split()):
+            candidates |= self.word_index.get(word, set())
+        return sorted(name for name in candidates if f" {self.match_key(name)} " in title_key)
+
+    def signature(self, name: str) -> Optional[Tuple]:
+        """Hashable summary of a show's episode layout (None for unknown shows)."""
+        entry = self.entries.get(normalize_show_name(name or ""))
+        return None if entry is None else (entry[1], tuple(entry[2]))
+
+    def episodes_in_season(self, name: str, season: int) -> Optional[int]:
+        """Episode count of a season, or None if the show is unknown."""
+        entry = self.entries.get(normalize_show_name(name or ""))
+        if entry is None:
+            return None
+        _, uniform, counts, _ = entry
+        if uniform is not None:
+            return uniform
+        return counts[season - 1] if 0 < season <= len(counts) else self.DEFAULT_EPISODES
+
+    def absolute_episode(self, name: str, season: int, episode: int) -> int:
+        entry = self.entries.get(normalize_show_name(name or ""))
+        if entry is None:
+            return (season - 1) * self.DEFAULT_EPISODES + episode
+        _, uniform, counts, prefix = entry
+        if uniform is not None:
+            return (season - 1) * uniform + episode
+        if season <= len(counts):
+            return prefix[season - 1] + episode
+        return prefix[-1] + (season - 1 - len(counts)) * self.DEFAULT_EPISODES + episode
+
+    def season_episode(self, name: str, absolute: int) -> Optional[Tuple[int, int]]:
+        """
+        Map an absolute episode number onto (season, episode). None if the show is unknown
+        or the number lies past the seasons its episode list covers.
+        """
+        entry = self.entries.get(normalize_show_name(name or ""))
+        if entry is None or absolute < 1:
+            return None
+        _, uniform, counts, prefix = entry
+        if uniform is not None:
+            if uniform < 1:
+                return None
+            season_index, episode_index = divmod(absolute - 1, uniform)
+            return season_index + 1, episode_index + 1
+        if absolute > prefix[-1]:
+            return None
+        season = bisect.bisect_left(prefix, absolute)
+        return season, absolute - prefix[season - 1]
+
+# --- Show Index ---
+class ShowIndex:
+    """
+    Lookup from show names to tracked shows, rebuilt whenever the tracked shows or
+    known shows change. Only exact (normalized) alias matches resolve to shows; an alias
+    can map to several entries when a show is tracked at two qualities or split by
+    season. The token index backs near_miss, which flags names that merely resemble
+    an alias (sequels, longer titles) so they can be sent to the model instead.
+    """
+    FUZZY_THRESHOLD = 0.6
+
+    def __init__(self, shows: List[Dict], known_names=()):
+        self.by_alias: Dict[str, List[Dict]] = {}
+        self.canonical: Dict[str, str] = {}
+        self.token_index: Dict[str, Set[str]] = {}
+        self.alias_tokens: Dict[str, frozenset] = {}
+        self.title_keys: Set[str] = set()
+
+        for name in known_names:
+            self.canonical.setdefault(normalize_show_name(name), name)
+        for show in shows:
+            for name in show['names']:
+                alias = normalize_show_name(name)
+                if not alias:
+                    continue
+                key = KnownShows.match_key(name)
+                if key:
+                    self.title_keys.add(f" {key} ")
+                entries = self.by_alias.setdefault(alias, [])
+                if not any(entry is show for entry in entries):
+                    entries.append(show)
+                self.canonical.setdefault(alias, name)
+                tokens = frozenset(alias.split())
+                self.alias_tokens[alias] = tokens
+                for token in tokens:
+                    self.token_index.setdefault(token, set()).add(alias)
+
+    def resolve(self, name: str) -> List[Dict]:
+        """The tracked shows a (parsed) name refers to exactly; empty if none."""
+        return self.by_alias.get(normalize_show_name(name or ""), [])
+
+    def mentioned_in(self, title: str) -> bool:
+        """True when a raw release title contains any tracked alias as whole words."""
+        title_key = f" {KnownShows.match_key(title)} "
+        return any(key in title_key for key in self.title_keys)
+
+    def matches(self, name: str, show: Dict) -> bool:
+        return any(entry is show for entry in self.resolve(name))
+
+    def near_miss(self, name: str) -> bool:
+        """True when a name matches no alias exactly but shares most of its words with one."""
+        normalized = normalize_show_name(name or "")
+        if not normalized or normalized in self.by_alias:
+            return False
+        tokens = frozenset(normalized.split())
+        candidates = set()
+        for token in tokens:
+            candidates |= self.token_index.get(token, set())
+        return any(
+            len(tokens & self.alias_tokens[alias]) / len(tokens | self.alias_tokens[alias]) >= self.FUZZY_THRESHOLD
+            for alias in candidates
+        )
+
+    def canonical_name(self, name: str) -> str:
+        """Map a name onto the matching known show or tracked alias spelling."""
+        return self.canonical.get(normalize_show_name(name), name)
+
+# --- Local Title Parser ---
+class TitleFastParser:
+    """
+    Deterministic parser for the common nyaa release title layouts.
+    parse() returns the parse_title dict shape (season is None when the title carries no
+    season marker), or None when no pattern matches and the title should go to the model.
+    """
+    GROUP_PREFIX = re.compile(r"^\s*(?:\[[^\]]*\]\s*|\([^)]*\)\s*)+")
+    QUALITY = re.compile(r"(?<!\d)(2160|1080|720|576|480|360)p\b", re.I)
+    BATCH_HINT = re.compile(r"\b(?:batch|complete)\b", re.I)
+    SEASON_SUFFIX = re.compile(r"\s+(?:S(\d{1,2})|Season\s*(\d{1,2})|(\d{1,2})(?:st|nd|rd|th)\s+Season)$", re.I)
+    # A dot ends a number unless a decimal part follows ("05.5" is a recap, not episode 5);
+    # "E07.1080p" still ends at the dot.
+    END = r"(?=[\s\[\(_]|\.(?!\d+\b)|$)"
+    PATTERNS = [
+        ('sxxexx', re.compile(r"^(?P<show>.+?)[\s._-]+S(?P<season>\d{1,2})E(?P<episode>\d{1,4})(?:v\d)?" + END, re.I)),
+        ('season_dash_episode', re.compile(r"^(?P<show>.+?)\s+S(?P<season>\d{1,2})\s+-\s+(?P<episode>\d{1,4})(?:v\d)?" + END, re.I)),
+        ('batch_range', re.compile(r"^(?P<show>.+?)\s+(?:-\s+)?(?P<open>[\(\[])?(?P<first>\d{1,4})\s*[-~]\s*(?P<last>\d{1,4})[\)\]]?" + END)),
+        ('season_batch', re.compile(r"^(?P<show>.+?)\s+(?:S(?P<season>\d{1,2})|Season\s*(?P<season_word>\d{1,2}))" + END, re.I)),
+        ('dash_episode', re.compile(r"^(?P<show>.+?)\s+-\s+(?P<episode>\d{1,4})(?:v\d)?" + END)),
+    ]
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hits: Dict[str, int] = {}
+
+    def parse(self, title: str) -> Optional[Tuple[str, Dict]]:
+        """Return (pattern_name, parsed) for the first confident match, else None."""
+        quality_match = self.QUALITY.search(title)
+        if not quality_match:
+            return None
+        quality = quality_match.group(1) + 'p'
+        is_batch_hint = bool(self.BATCH_HINT.search(title))
+        body = self.GROUP_PREFIX.sub("", title).strip()
+
+        for name, pattern in self.PATTERNS:
+            match = pattern.match(body)
+            if not match:
+                continue
+            groups = match.groupdict()
+            show, marker_season = self._clean_show(groups['show'])
+            if not show:
+                continue
+
+            if name == 'batch_range':
+                first, last = int(groups['first']), int(groups['last'])
+                if last <= first or not (groups['open'] or is_batch_hint):
+                    continue
+                episodes = list(range(first, last + 1))
+                return name, self._result(show, marker_season, None, True, quality, episodes)
+            if name == 'season_batch':
+                if not is_batch_hint:
+                    continue
+                season = int(groups['season'] or groups['season_word'])
+                return name, self._result(show, season, None, True, quality, [])
+            if is_batch_hint:
+                # A single-episode layout tagged as a batch is ambiguous; let the model decide.
+                return None
+
+            season = int(groups['season']) if groups.get('season') else marker_season
+            return name, self._result(show, season, int(groups['episode']), False, quality, [])
+        return None
+
+    def record(self, name: str):
+        with self.lock:
+            self.hits[name] = self.hits.get(name, 0) + 1
+
+    def reset_stats(self):
+        with self.lock:
+            self.hits = {}
+
+    def stats_summary(self) -> str:
+        with self.lock:
+            hits = dict(self.hits)
+        total = sum(hits.values())
+        if not total:
+            return "Local parser: no titles parsed"
+        parts = ", ".join(f"{name} {count}" for name, count in sorted(hits.items(), key=lambda item: -item[1]))
+        model_share = 100.0 * hits.get('model', 0) / total
+        return f"Local parser: {parts} ({model_share:.1f}% of titles sent to the model)"
+
+    def _clean_show(self, raw: str) -> Tuple[str, Optional[int]]:
+        # Dots separate words only in scene-style names ("Show.Name"); elsewhere they
+        # belong to the name ("Kaiju No. 8").
+        separators = r"[._]+" if " " not in raw.strip() else r"_+"
+        show = re.sub(separators, " ", raw).strip(" -")
+        season = None
+        marker = self.SEASON_SUFFIX.search(show)
+        if marker:
+            season = int(next(group for group in marker.groups() if group))
+            show = show[:marker.start()].strip(" -")
+        return show, season
+
+    @staticmethod
+    def _result(show: str, season: Optional[int], episode: Optional[int], is_batch: bool,
+                quality: str, batch_episodes: List[int]) -> Dict:
+        return {
+            'show': show,
+            'season': season,
+            'episode': episode,
+            'is_batch': is_batch,
+            'quality': quality,
+            'batch_episodes': batch_episodes
+        }
+
+# --- Candidate Filtering ---
+class CandidateFilter:
+    """
+    Cheap checks on raw search result rows for one wanted episode, run before any
+    title parsing. A row survives only if it carries the show's quality, contains one
+    of its aliases as whole words and mentions the episode (or a batch that may hold
+    it). Survivors are ranked by how specific the episode match is, then by seeders.
+    With batch_only set, only season packs that may hold the episode survive.
+    """
+    EXACT, DASH, BATCH = 3, 2, 1
+    RANGE = re.compile(r"(?<![\w.])(\d{1,4})\s*[-~]\s*(\d{1,4})(?![\w.])")
+
+    def __init__(self, names: List[str], quality: str, season: int, episode: int, absolute: int,
+                 batch_only: bool = False):
+        self.alias_keys = [f" {key} " for key in (KnownShows.match_key(name) for name in names) if key]
+        self.quality = re.compile(rf"(?<!\d){re.escape(quality)}\b", re.I) if quality else None
+        self.season, self.episodes = season, {episode, absolute}
+        self.batch_only = batch_only
+        numbers = "|".join(str(number) for number in sorted(self.episodes))
+        end = r"(?:v\d)?" + TitleFastParser.END
+        self.exact = re.compile(rf"\bS0*{season}\s*(?:E0*{episode}|\s-\s+0*{episode}){end}", re.I)
+        self.dash = re.compile(rf"\s-\s+0*(?:{numbers}){end}")
+        self.season_marker = re.compile(rf"\b(?:S0*{season}|Season\s*0*{season})\b", re.I)
+        # A season marker not followed by an episode number, e.g. "S02 [1080p]" or "(Season 2)".
+        self.season_pack = re.compile(rf"\b(?:S0*{season}|Season\s*0*{season})\b(?!\s*(?:E\d|-\s*\d))", re.I)
+
+    def score(self, title: str) -> int:
+        """Rank of a raw title for the wanted episode; 0 means it can't match."""
+        if self.quality and not self.quality.search(title):
+            return 0
+        title_key = f" {KnownShows.match_key(title)} "
+        if not any(alias in title_key for alias in self.alias_keys):
+            return 0
+        if not self.batch_only:
+            if self.exact.search(title):
+                return self.EXACT
+            if self.dash.search(title):
+                return self.DASH
+        return self.BATCH if self.is_batch(title) else 0
+
+    def is_batch(self, title: str) -> bool:
+        for match in self.RANGE.finditer(title):
+            first, last = int(match.group(1)), int(match.group(2))
+            if first < last and any(first <= number <= last for number in self.episodes):
+                return True
+        if self.season_pack.search(title):
+            return True
+        return bool(TitleFastParser.BATCH_HINT.search(title)) and (self.season == 1 or bool(self.season_marker.search(title)))
+
+    def rank(self, rows: List[Dict]) -> List[Dict]:
+        scored = [(self.score(row['title']), row) for row in rows]
+        survivors = [(score, row) for score, row in scored if score]
+        survivors.sort(key=lambda item: (-item[0], -item[1].get('seeders', 0)))
+        return [row for _, row in survivors]
+
+# --- Model Output Validation ---
+class ParsedTitle(TypedDict):
+    show: str
+    season: int
+    episode: Optional[int]
+    is_batch: bool
+    quality: str
+    batch_episodes: List[int]
+
+PARSED_TITLE_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'show': {'type': 'string'},
+        'season': {'type': 'integer'},
+        'episode': {'type': ['integer', 'null']},
+        'is_batch': {'type': 'boolean'},
+        'quality': {'type': 'string'},
+        'batch_episodes': {'type': 'array', 'items': {'type': 'integer'}}
+    },
+    'required': list(ParsedTitle.__annotations__),
+    'additionalProperties': False
+}
+
+# Batch items echo the index of the title they parse, so replies that skip or reorder
+# titles can't shift one title's parse onto another.
+PARSED_BATCH_ITEM_SCHEMA = {
+    **PARSED_TITLE_SCHEMA,
+    'properties': {'index': {'type': 'integer'}, **PARSED_TITLE_SCHEMA['properties']},
+    'required': ['index'] + PARSED_TITLE_SCHEMA['required']
+}
+
+# Structured outputs need an object at the root, so batches are wrapped in {"results": [...]}.
+PARSED_BATCH_SCHEMA = {
+    'type': 'object',
+    'properties': {'results': {'type': 'array', 'items': PARSED_BATCH_ITEM_SCHEMA}},
+    'required': ['results'],
+    'additionalProperties': False
+}
+
+class ModelOutputError(ValueError):
+    """
+    A model reply that can't be used. kind is one of: api_error, refusal, empty,
+    invalid_json, not_object, missing_field, wrong_type, count_mismatch.
+    """
+    REPAIRABLE = frozenset({'invalid_json', 'not_object', 'missing_field', 'wrong_type'})
+
+    def __init__(self, kind: str, message: str, reply: Optional[str] = None):
+        super().__init__(f"{kind}: {message}")
+        self.kind = kind
+        self.reply = reply
+
+    @property
+    def repairable(self) -> bool:
+        return self.kind in self.REPAIRABLE
+
+def strip_markdown_fences(raw_response: str) -> str:
+    raw_response = raw_response.strip()
+    if raw_response.startswith("```"):
+        raw_response = raw_response.split("\n", 1)[1] if "\n" in raw_response else ""
+        if "```" in raw_response:
+            raw_response = raw_response.rsplit("```", 1)[0]
+    return raw_response.strip()
+
+def load_model_json(raw: str):
+    try:
+        return json.loads(strip_markdown_fences(raw))
+    except ValueError as e:
+        raise ModelOutputError('invalid_json', str(e))
+
+def validate_parsed_title(data) -> ParsedTitle:
+    """Check a model reply against ParsedTitle, raising ModelOutputError on any mismatch."""
+    if not isinstance(data, dict):
+        raise ModelOutputError('not_object', f"expected an object, got {type(data).__name__}")
+    missing = [field for field in ParsedTitle.__annotations__ if field not in data]
+    if missing:
+        raise ModelOutputError('missing_field', ", ".join(missing))
+
+    def is_int(value) -> bool:
+        return isinstance(value, int) and not isinstance(value, bool)
+
+    if not isinstance(data['show'], str) or not data['show'].strip():
+        raise ModelOutputError('wrong_type', "show must be a non-empty string")
+    if not is_int(data['season']) or data['season'] < 0:
+        raise ModelOutputError('wrong_type', "season must be a non-negative integer")
+    if not isinstance(data['is_batch'], bool):
+        raise ModelOutputError('wrong_type', "is_batch must be a boolean")
+    if data['episode'] is not None and not is_int(data['episode']):
+        raise ModelOutputError('wrong_type', "episode must be an integer or null")
+    if data['episode'] is None and not data['is_batch']:
+        raise ModelOutputError('wrong_type', "episode is required unless is_batch is true")
+    if not isinstance(data['quality'], str):
+        raise ModelOutputError('wrong_type', "quality must be a string")
+    batch_episodes = data['batch_episodes']
+    if not isinstance(batch_episodes, list) or not all(is_int(ep) for ep in batch_episodes):
+        raise ModelOutputError('wrong_type', "batch_episodes must be an array of integers")
+
+    return ParsedTitle(
+        show=data['show'].strip(),
+        season=data['season'],
+        episode=data['episode'],
+        is_batch=data['is_batch'],
+        quality=data['quality'],
+        batch_episodes=list(batch_episodes)
+    )
+
+class ModelFailureStats:
+    """Per-scan counts of unusable model replies by kind, and of repair re-asks."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset_stats()
+
+    def record(self, kind: str):
+        with self.lock:
+            self.failures[kind] = self.failures.get(kind, 0) + 1
+
+    def record_repair(self, succeeded: bool):
+        with self.lock:
+            self.repairs += 1
+            self.repaired += int(succeeded)
+
+    def reset_stats(self):
+        with self.lock:
+            self.failures: Dict[str, int] = {}
+            self.repairs = 0
+            self.repaired = 0
+
+    def stats_summary(self) -> str:
+        with self.lock:
+            failures = dict(self.failures)
+            repairs, repaired = self.repairs, self.repaired
+        if not failures:
+            return "Model replies: no failures"
+        parts = ", ".join(f"{kind} {count}" for kind, count in sorted(failures.items(), key=lambda item: -item[1]))
+        return f"Model reply failures: {parts} ({repaired}/{repairs} repairs succeeded)"
+
+# --- Feed Parsing ---
+NYAA_NS = {'nyaa': 'https://nyaa.si/xmlns/nyaa'}
+
+def parse_feed_items(xml_bytes: bytes, trackers: List[str]) -> List[Dict]:
+    """Extract upload records (id, title, magnet, pub_date) from a nyaa RSS feed, newest first."""
+    items = []
+    for item in ET.fromstring(xml_bytes).iter('item'):
+        title = (item.findtext('title') or "").strip()
+        guid = item.findtext('guid') or item.findtext('link') or ""
+        info_hash = item.findtext('nyaa:infoHash', namespaces=NYAA_NS)
+        id_match = re.search(r"/view/(\d+)", guid)
+        if not title or not info_hash or not id_match:
+            continue
+        magnet = f"magnet:?xt=urn:btih:{info_hash}&dn={quote(title)}" + "".join(f"&tr={quote(tracker, safe='')}" for tracker in trackers)
+        items.append({
+            'id': int(id_match.group(1)),
+            'title': title,
+            'magnet': magnet,
+            'pub_date': item.findtext('pubDate')
+        })
+    items.sort(key=lambda entry: entry['id'], reverse=True)
+    return items
+
+# --- Scan Session ---
+class ScanSession:
+    """
+    Torrents seen during one scan, shared by every query, episode and show worker.
+    Rows are keyed by nyaa view id, or by infohash when there is none, so a release
+    that turns up under many queries is parsed once and its magnet is opened once.
+    """
+    BTIH = re.compile(r"urn:btih:([0-9a-f]{40}|[a-z2-7]{32})", re.I)
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.parsed: Dict[str, Dict] = {}
+        self.opened: Set[str] = set()
+        self.reused = 0
+        self.duplicate_magnets = 0
+
+    @classmethod
+    def magnet_key(cls, magnet: str) -> str:
+        match = cls.BTIH.search(magnet or "")
+        return f"btih:{match.group(1).lower()}" if match else magnet
+
+    @classmethod
+    def row_key(cls, row: Dict) -> str:
+        if row.get('view_id'):
+            return f"view:{row['view_id']}"
+        return cls.magnet_key(row['magnet'])
+
+    def get(self, row: Dict) -> Optional[Dict]:
+        with self.lock:
+            parsed = self.parsed.get(self.row_key(row))
+            if parsed is None:
+                return None
+            self.reused += 1
+            return dict(parsed)
+
+    def put(self, row: Dict, parsed: Dict):
+        with self.lock:
+            self.parsed[self.row_key(row)] = dict(parsed)
+
+    def claim_magnet(self, magnet: str) -> bool:
+        """True the first time a torrent's magnet is claimed during this scan."""
+        key = self.magnet_key(magnet)
+        with self.lock:
+            if key in self.opened:
+                self.duplicate_magnets += 1
+                return False
+            self.opened.add(key)
+            return True
+
+    def stats_summary(self) -> str:
+        with self.lock:
+            return (f"Scan dedup: {len(self.parsed)} torrents parsed, {self.reused} repeat rows reused, "
+                    f"{self.duplicate_magnets} duplicate magnets skipped")
+
+# --- Parse Cache ---
+class ParseCache:
+    """
+    Persistent title -> parsed-metadata cache backed by SQLite.
+    Entries are keyed by the exact title plus a context fingerprint (known shows and
+    model), and the least recently used entries are evicted once max_entries is exceeded.
+    """
+    TOUCH_FLUSH_THRESHOLD = 256
+
+    def __init__(self, path: str, max_entries: int = 20000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.pending_touches: Dict[Tuple[str, str], float] = {}
+
+        self.conn = connect_sqlite(path)
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS parsed_titles (
+                title TEXT NOT NULL,
+                context TEXT NOT NULL,
+                result TEXT NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (title, context)
+            )"""
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_parsed_titles_last_used ON parsed_titles (last_used)")
+        self.conn.commit()
+        self.size = self.conn.execute("SELECT COUNT(*) FROM parsed_titles").fetchone()[0]
+
+    def get(self, title: str, context: str) -> Optional[Dict]:
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT result FROM parsed_titles WHERE title = ? AND context = ?", (title, context)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            # Recency updates are batched so cache hits don't each cost a commit.
+            self.pending_touches[(title, context)] = time.time()
+            if len(self.pending_touches) >= self.TOUCH_FLUSH_THRESHOLD:
+                self._flush_touches()
+                self.conn.commit()
+            return json.loads(row[0])
+
+    def put(self, title: str, context: str, result: Dict):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO parsed_titles (title, context, result, last_used) VALUES (?, ?, ?, ?)",
+                (title, context, json.dumps(result), time.time())
+            )
+            self.size += 1
+            if self.size > self.max_entries:
+                self._evict()
+            self.conn.commit()
+
+    def flush(self):
+        with self.lock:
+            self._flush_touches()
+            self.conn.commit()
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+
+    def stats_summary(self) -> str:
+        lookups = self.hits + self.misses
+        hit_rate = (100.0 * self.hits / lookups) if lookups else 0.0
+        return f"Title cache: {self.hits} hits, {self.misses} misses ({hit_rate:.1f}% hit rate, {self.size} entries)"
+
+    def close(self):
+        self.flush()
+        with self.lock:
+            self.conn.close()
+
+    def _flush_touches(self):
+        if self.pending_touches:
+            self.conn.executemany(
+                "UPDATE parsed_titles SET last_used = ? WHERE title = ? AND context = ?",
+                [(used, title, context) for (title, context), used in self.pending_touches.items()]
+            )
+            self.pending_touches.clear()
+
+    def _evict(self):
+        self._flush_touches()
+        # size is only an estimate (replacements are counted as inserts), so recount first.
+        self.size = self.conn.execute("SELECT COUNT(*) FROM parsed_titles").fetchone()[0]
+        excess = self.size - self.max_entries
+        if excess <= 0:
+            return
+        # Evict a little extra so we don't run this on every subsequent insert.
+        excess += max(1, self.max_entries // 10)
+        self.conn.execute(
+            "DELETE FROM parsed_titles WHERE rowid IN (SELECT rowid FROM parsed_titles ORDER BY last_used ASC LIMIT ?)",
+            (excess,)
+        )
+        self.size = self.conn.execute("SELECT COUNT(*) FROM parsed_titles").fetchone()[0]
+        debug_log(f"Parse cache evicted {excess} entries, {self.size} remaining")
+
+# --- Response Cache ---
+class ResponseCache:
+    """
+    On-disk cache of nyaa search pages keyed by the normalized request.
+    Stores validators (ETag / Last-Modified), a hash of the body and the rows extracted
+    from it, so fresh entries skip the network and unchanged bodies skip HTML parsing.
+    """
+    def __init__(self, path: str, ttl: float = 900, max_entries: int = 5000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.stats = {'fresh': 0, 'not_modified': 0, 'unchanged': 0, 'parsed': 0, 'bytes': 0}
+
+        self.conn = connect_sqlite(path)
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS search_pages (
+                key TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                body_hash TEXT NOT NULL,
+                rows TEXT NOT NULL,
+                fetched_at REAL NOT NULL
+            )"""
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_search_pages_fetched_at ON search_pages (fetched_at)")
+        self.conn.commit()
+        self.size = self.conn.execute("SELECT COUNT(*) FROM search_pages").fetchone()[0]
+
+    @staticmethod
+    def make_key(url: str, params: Dict) -> str:
+        normalized = {
+            name: re.sub(r"\s+", " ", str(value).strip().lower()) if name == 'q' else str(value)
+            for name, value in params.items()
+        }
+        return url.rstrip('/') + '?' + '&'.join(f"{name}={normalized[name]}" for name in sorted(normalized))
+
+    def get(self, key: str) -> Optional[Dict]:
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT etag, last_modified, body_hash, rows, fetched_at FROM search_pages WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        etag, last_modified, body_hash, rows, fetched_at = row
+        return {
+            'etag': etag,
+            'last_modified': last_modified,
+            'body_hash': body_hash,
+            'rows': json.loads(rows),
+            'fetched_at': fetched_at,
+            'fresh': time.time() - fetched_at < self.ttl
+        }
+
+    def put(self, key: str, etag: Optional[str], last_modified: Optional[str], body_hash: str, rows: List[Dict]):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO search_pages (key, etag, last_modified, body_hash, rows, fetched_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, etag, last_modified, body_hash, json.dumps(rows), time.time())
+            )
+            self.size += 1
+            if self.size > self.max_entries:
+                self._evict()
+            self.conn.commit()
+
+    def touch(self, key: str):
+        """Mark an entry as freshly validated without rewriting its rows."""
+        with self.lock:
+            self.conn.execute("UPDATE search_pages SET fetched_at = ? WHERE key = ?", (time.time(), key))
+            self.conn.commit()
+
+    def record(self, outcome: str, transferred: int = 0):
+        with self.lock:
+            self.stats[outcome] += 1
+            self.stats['bytes'] += transferred
+
+    def reset_stats(self):
+        with self.lock:
+            self.stats = {name: 0 for name in self.stats}
+
+    def stats_summary(self) -> str:
+        with self.lock:
+            stats = dict(self.stats)
+        return (f"Search page cache: {stats['fresh']} fresh, {stats['not_modified']} not modified, "
+                f"{stats['unchanged']} unchanged, {stats['parsed']} parsed, {stats['bytes'] / 1024:.0f} KiB transferred")
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def _evict(self):
+        # size is only an estimate (replacements are counted as inserts), so recount first.
+        self.size = self.conn.execute("SELECT COUNT(*) FROM search_pages").fetchone()[0]
+        excess = self.size - self.max_entries
+        if excess <= 0:
+            return
+        # Evict a little extra so we don't run this on every subsequent insert.
+        excess += max(1, self.max_entries // 10)
+        self.conn.execute(
+            "DELETE FROM search_pages WHERE rowid IN (SELECT rowid FROM search_pages ORDER BY fetched_at ASC LIMIT ?)",
+            (excess,)
+        )
+        self.size = self.conn.execute("SELECT COUNT(*) FROM search_pages").fetchone()[0]
+        debug_log(f"Response cache evicted {excess} entries, {self.size} remaining")
+
+# --- Poll Scheduling ---
+def parse_timestamp(text: Optional[str]) -> Optional[float]:
+    """Epoch seconds for a current_timestamp() string, or None."""
+    if not text:
+        return None
+    try:
+        return datetime.strptime(text, "%Y-%m-%d %H:%M:%S").timestamp()
+    except ValueError:
+        return None
+
+class PollScheduler:
+    """
+    When each show is next due for polling. A show with a release cadence (the median
+    gap between its recent found_at times, ignoring gaps under min_interval) is due once
+    its next episode is expected (last find + cadence), then every min_interval after its
+    last check. Shows without a cadence wait base_interval. Each scan that finds nothing
+    multiplies the wait by backoff_factor, no wait exceeds max_interval, and shows that
+    need nothing are polled every max_interval.
+    """
+    def __init__(self, min_interval: float, base_interval: float, max_interval: float, backoff_factor: float):
+        self.min_interval = min_interval
+        self.base_interval = base_interval
+        self.max_interval = max_interval
+        self.backoff_factor = backoff_factor
+
+    def cadence(self, show: Dict) -> Optional[float]:
+        found = [stamp for stamp in (parse_timestamp(text) for text in show.get('found_at', [])) if stamp]
+        # Finds closer together than min_interval are one catch-up, not a release gap.
+        gaps = sorted(later - earlier for earlier, later in zip(found, found[1:]) if later - earlier >= self.min_interval)
+        return gaps[len(gaps) // 2] if gaps else None
+
+    def next_due(self, show: Dict, now: float) -> float:
+        """Epoch seconds at which a show is due (now for shows never checked)."""
+        last_checked = parse_timestamp(show.get('last_checked'))
+        if last_checked is None:
+            return now
+        if not show['needed_episodes']:
+            return last_checked + self.max_interval
+        backoff = self.backoff_factor ** show.get('idle_scans', 0)
+        cadence = self.cadence(show)
+        if cadence is None:
+            due = last_checked + max(self.min_interval, self.base_interval * backoff)
+        else:
+            expected = parse_timestamp(show['found_at'][-1]) + cadence
+            due = max(last_checked + self.min_interval * backoff, expected)
+        return min(due, last_checked + self.max_interval)
+
+    def is_due(self, show: Dict, now: float) -> bool:
+        return self.next_due(show, now) <= now
+
+# --- Magnet Sinks ---
+class MagnetSink(ABC):
+    """Destination for the magnet links of matched releases."""
+    @abstractmethod
+    def send(self, magnet: str, title: str):
+        """Deliver one magnet link."""
+
+class BrowserSink(MagnetSink):
+    """Hand magnets to the desktop's default handler, usually a torrent client."""
+    def send(self, magnet: str, title: str):
+        webbrowser.open(magnet)
+
+class PrintSink(MagnetSink):
+    """Print one magnet per line, for piping into other tools."""
+    def __init__(self, stream=None):
+        self.stream = stream
+        self.lock = threading.Lock()
+
+    def send(self, magnet: str, title: str):
+        with self.lock:
+            print(magnet, file=self.stream or sys.stdout, flush=True)
+
+class FileSink(MagnetSink):
+    """Append magnets, one per line, to a text file."""
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def send(self, magnet: str, title: str):
+        with self.lock, open(self.path, 'a', encoding='utf-8') as f:
+            f.write(magnet + "\n")
+
+class WatchDirSink(MagnetSink):
+    """
+    Write each magnet to <infohash>.magnet in a torrent client's watch directory.
+    Files are written under a temporary name first so the client never sees a partial file.
+    """
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def send(self, magnet: str, title: str):
+        key = ScanSession.magnet_key(magnet)
+        name = key[len('btih:'):] if key.startswith('btih:') else hashlib.sha1(magnet.encode('utf-8')).hexdigest()
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.part')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(magnet)
+        os.replace(tmp_path, os.path.join(self.directory, f"{name}.magnet"))
+
+def make_sink(spec: str) -> MagnetSink:
+    """Build a sink from 'browser', 'print', 'file:PATH' or 'watch:DIR'."""
+    kind, _, target = spec.partition(':')
+    if kind == 'browser':
+        return BrowserSink()
+    if kind == 'print':
+        return PrintSink()
+    if kind == 'file' and target:
+        return FileSink(target)
+    if kind == 'watch' and target:
+        return WatchDirSink(target)
+    raise ValueError(f"Unknown magnet sink '{spec}' (expected browser, print, file:PATH or watch:DIR)")
+
+# --- Scan Metrics ---
+def percentile(ordered: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list of samples."""
+    if not ordered:
+        return 0.0
+    return ordered[max(1, math.ceil(fraction * len(ordered))) - 1]
+
+def prometheus_label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+class ScanMetrics:
+    """
+    Timings and counters for one scan. stage(name) times a block and add(name, n)
+    bumps a counter; both count towards the whole scan and towards the show bound
+    to the calling thread with bind_show, so worker threads report per show.
+    """
+    QUANTILES = (0.5, 0.95, 0.99)
+    # Hit rate name -> (hit counters, miss counters)
+    HIT_RATES = {
+        'local_parser': (('titles_local',), ('parse_cache_hits', 'parse_cache_misses')),
+        'parse_cache': (('parse_cache_hits',), ('parse_cache_misses',)),
+        'scan_session': (('rows_reused',), ('rows_parsed',)),
+        'response_cache': (('response_cache_fresh', 'response_cache_not_modified', 'response_cache_unchanged'),
+                           ('response_cache_parsed',))
+    }
+    SUMMARY_STAGES = ('show', 'fetch', 'extract', 'parse', 'model', 'save')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.started_at = current_timestamp()
+        self.started = time.perf_counter()
+        self.finished: Optional[float] = None
+        self.scan = self.new_bucket()
+        self.shows: Dict[str, Dict] = {}
+
+    @staticmethod
+    def new_bucket() -> Dict:
+        return {'timings': {}, 'counters': {}}
+
+    @contextmanager
+    def bind_show(self, name: str):
+        """Attribute what the calling thread records to a show until the block exits."""
+        self.local.show = name
+        try:
+            yield
+        finally:
+            self.local.show = None
+
+    def buckets(self) -> List[Dict]:
+        show = getattr(self.local, 'show', None)
+        if show is None:
+            return [self.scan]
+        if show not in self.shows:
+            self.shows[show] = self.new_bucket()
+        return [self.scan, self.shows[show]]
+
+    def observe(self, stage: str, seconds: float):
+        with self.lock:
+            for bucket in self.buckets():
+                bucket['timings'].setdefault(stage, []).append(seconds)
+
+    @contextmanager
+    def stage(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started)
+
+    def add(self, name: str, amount: int = 1):
+        if not amount:
+            return
+        with self.lock:
+            for bucket in self.buckets():
+                bucket['counters'][name] = bucket['counters'].get(name, 0) + amount
+
+    def finish(self):
+        self.finished = time.perf_counter()
+
+    @classmethod
+    def describe(cls, bucket: Dict) -> Dict:
+        stages = {}
+        for stage, samples in bucket['timings'].items():
+            ordered = sorted(samples)
+            stages[stage] = {'count': len(ordered), 'total': round(sum(ordered), 6), 'max': round(ordered[-1], 6)}
+            for quantile in cls.QUANTILES:
+                stages[stage][f"p{round(quantile * 100)}"] = round(percentile(ordered, quantile), 6)
+        counters = dict(bucket['counters'])
+        hit_rates = {}
+        for name, (hit_keys, miss_keys) in cls.HIT_RATES.items():
+            hits = sum(counters.get(key, 0) for key in hit_keys)
+            total = hits + sum(counters.get(key, 0) for key in miss_keys)
+            if total:
+                hit_rates[name] = round(hits / total, 4)
+        return {'stages': stages, 'counters': counters, 'hit_rates': hit_rates}
+
+    def summary(self, extra: Optional[Dict] = None) -> Dict:
+        """The scan as a JSON-ready dict: per-stage latency percentiles, counters and hit rates."""
+        with self.lock:
+            report = {
+                'started_at': self.started_at,
+                'duration_seconds': round((self.finished or time.perf_counter()) - self.started, 3),
+                **self.describe(self.scan),
+                'shows': {name: self.describe(bucket) for name, bucket in sorted(self.shows.items())}
+            }
+        report.update(extra or {})
+        return report
+
+    def prometheus(self) -> str:
+        """The scan-wide figures in the Prometheus text exposition format."""
+        report = self.summary()
+        lines = [
+            "# HELP anime_tracker_stage_seconds Time spent in each scan stage during the last scan.",
+            "# TYPE anime_tracker_stage_seconds summary"
+        ]
+        for stage, figures in sorted(report['stages'].items()):
+            for quantile in self.QUANTILES:
+                value = figures[f"p{round(quantile * 100)}"]
+                lines.append(f'anime_tracker_stage_seconds{{stage="{stage}",quantile="{quantile}"}} {value}')
+            lines.append(f'anime_tracker_stage_seconds_sum{{stage="{stage}"}} {figures["total"]}')
+            lines.append(f'anime_tracker_stage_seconds_count{{stage="{stage}"}} {figures["count"]}')
+        lines += [
+            "# HELP anime_tracker_scan_events Counted events (requests, bytes, tokens, cache outcomes) in the last scan.",
+            "# TYPE anime_tracker_scan_events gauge"
+        ]
+        for name, value in sorted(report['counters'].items()):
+            lines.append(f'anime_tracker_scan_events{{name="{name}"}} {value}')
+        lines += [
+            "# HELP anime_tracker_hit_ratio Share of lookups answered without the slower path in the last scan.",
+            "# TYPE anime_tracker_hit_ratio gauge"
+        ]
+        for name, value in sorted(report['hit_rates'].items()):
+            lines.append(f'anime_tracker_hit_ratio{{cache="{name}"}} {value}')
+        lines += [
+            "# HELP anime_tracker_show_seconds Time spent scanning each show in the last scan.",
+            "# TYPE anime_tracker_show_seconds gauge"
+        ]
+        for name, show in report['shows'].items():
+            if 'show' in show['stages']:
+                lines.append(f'anime_tracker_show_seconds{{show="{prometheus_label(name)}"}} {show["stages"]["show"]["total"]}')
+        lines += [
+            "# HELP anime_tracker_scan_duration_seconds Wall time of the last scan.",
+            "# TYPE anime_tracker_scan_duration_seconds gauge",
+            f"anime_tracker_scan_duration_seconds {report['duration_seconds']}"
+        ]
+        return "\n".join(lines) + "\n"
+
+    def stats_summary(self) -> str:
+        with self.lock:
+            timings = self.scan['timings']
+            counters = dict(self.scan['counters'])
+            parts = []
+            for stage in self.SUMMARY_STAGES:
+                if stage in timings:
+                    ordered = sorted(timings[stage])
+                    parts.append(f"{stage} {len(ordered)}x p50 {percentile(ordered, 0.5):.2f}s p95 {percentile(ordered, 0.95):.2f}s")
+        tokens = counters.get('model_total_tokens', 0)
+        transferred = counters.get('bytes_received', 0)
+        return (f"Scan timing: {', '.join(parts) or 'nothing timed'}; "
+                f"{transferred / 1024:.0f} KiB received, {tokens} model tokens")
+
+# --- Tracker Engine ---
+class TrackerEngine:
+    """
+    Everything a scan needs, without a GUI. Front ends receive log lines through
+    on_log(lines), a list of (message, level) pairs, status text through
+    on_status(text) and episodes a scan marked downloaded through
+    on_episodes_changed(show, pairs). All may be called from scan worker threads.
+    """
+    DEFAULT_CONFIG = {
+        'openai_model': 'gpt-4o-mini',
+        'nyaa_url': 'https://nyaa.si/',
+        'known_shows_file': 'known_shows.json',
+        'log_file': 'anime_tracker.log',
+        'log_level': 'DEBUG',
+        # Where matched magnets go: 'browser', 'print', 'file:PATH' or 'watch:DIR'.
+        'magnet_sink': 'browser',
+        'state_backend': 'sqlite',
+        'state_file': 'tracked_shows.json',
+        'state_db_file': 'tracked_shows.db',
+        'save_debounce_seconds': 2.0,
+        'parse_cache_file': 'parse_cache.db',
+        'parse_cache_max_entries': 20000,
+        'parse_batch_size': 75,
+        # Pre-filtered search rows are parsed this many at a time until one matches.
+        'candidate_parse_window': 4,
+        # Search for a season pack first when at least this share of a season is missing.
+        'batch_search_threshold': 0.75,
+        # Constrain model replies with a JSON schema (needs a model that supports structured outputs).
+        'openai_structured_output': True,
+        'response_cache_file': 'response_cache.db',
+        'response_cache_ttl': 900,
+        'response_cache_max_entries': 5000,
+        # Per-stage timings and counters of the last scan (see ScanMetrics); None disables a file.
+        'metrics_file': 'scan_metrics.json',
+        'metrics_prometheus_file': None,
+        'scan_mode': 'search',
+        # Scheduled polling: per-show intervals in seconds (see PollScheduler).
+        'auto_poll': False,
+        'poll_tick_seconds': 60,
+        'poll_min_interval': 900,
+        'poll_base_interval': 6 * 3600,
+        'poll_max_interval': 7 * 24 * 3600,
+        'poll_backoff_factor': 2.0,
+        'poll_history': 10,
+        # Feed mode has no per-show schedule; Auto Poll checks the feed this often.
+        'feed_poll_interval': 900,
+        'feed_params': {'page': 'rss', 'f': 0, 'c': '0_0', 'q': ''},
+        'feed_limit': 75,
+        'feed_state_file': 'feed_state.json',
+        # Checks a feed upload whose title failed to parse is retried on before it is skipped.
+        'feed_parse_retries': 3,
+        'feed_trackers': ['http://nyaa.tracker.wf:7777/announce'],
+        'openai_url': 'https://api.openai.com/',
+        # Retries of a throttled or failed model request (the SDK's own retries are disabled).
+        'openai_max_retries': 3,
+        'scan_workers': 4,
+        'max_concurrent_requests': 6,
+        'per_host_concurrency': 3,
+        'http_pool_size': 10,
+        'http_timeout': 10,
+        'http_max_retries': 3,
+        'http_backoff_base': 1.0,
+        'http_backoff_max': 30.0,
+        # Requests (or, for 'openai_tokens', estimated prompt tokens) per second per upstream.
+        'rate_limits': {
+            'nyaa.si': {'rate': 2.0, 'burst': 4},
+            'openai': {'rate': 5.0, 'burst': 5},
+            'openai_tokens': {'rate': 3000.0, 'burst': 30000},
+            'default': {'rate': 2.0, 'burst': 2}
+        }
+    }
+
+    def __init__(self, config: Optional[Dict] = None, sink: Optional[MagnetSink] = None,
+                 on_log=None, on_status=None, on_episodes_changed=None):
+        self.config = copy.deepcopy(self.DEFAULT_CONFIG)
+        self.config.update(config or {})
+        configure_logging(self.config['log_file'], self.config['log_level'])
+        self.sink = sink or make_sink(self.config['magnet_sink'])
+        self.on_log = on_log
+        self.on_status = on_status
+        self.on_episodes_changed = on_episodes_changed
+        self.scan_log_buffer = threading.local()
+        # Per worker: search requests that failed during the current show's pass.
+        self.scan_pass = threading.local()
+
+        self.known_shows = self.load_known_shows()
+        self.catalog = KnownShows(self.known_shows)
+        self.parse_cache = ParseCache(self.config['parse_cache_file'], self.config['parse_cache_max_entries'])
+        self.title_parser = TitleFastParser()
+        self.model_failures = ModelFailureStats()
+        self.response_cache = ResponseCache(
+            self.config['response_cache_file'],
+            self.config['response_cache_ttl'],
+            self.config['response_cache_max_entries']
+        )
+        self._parse_context = None
+        self._prompt_cache: Dict[frozenset, str] = {}
+        self._openai_client = None
+        self._openai_client_lock = threading.Lock()
+
+        # State
+        self.tracked_shows = []
+        self.show_index = ShowIndex([])
+        self.needed_signatures: Dict[str, Tuple] = {}
+        self.feed_state = self.load_feed_state()
+
+        # Stop event for scanning
+        self.stop_scan_event = threading.Event()
+        self.scan_session = ScanSession()
+        self.metrics = ScanMetrics()
+        self.scheduler = PollScheduler(
+            self.config['poll_min_interval'],
+            self.config['poll_base_interval'],
+            self.config['poll_max_interval'],
+            self.config['poll_backoff_factor']
+        )
+
+        # Shared between scan workers
+        self.state_lock = threading.RLock()
+        self.request_limiter = RequestLimiter(self.config['max_concurrent_requests'], self.config['per_host_concurrency'])
+        self.rate_limits = RateLimiterRegistry(self.config['rate_limits'])
+        self.http = HttpClient(
+            pool_size=self.config['http_pool_size'],
+            timeout=self.config['http_timeout'],
+            max_retries=self.config['http_max_retries'],
+            backoff_base=self.config['http_backoff_base'],
+            backoff_max=self.config['http_backoff_max'],
+            limiter=self.request_limiter,
+            rate_limits=self.rate_limits,
+            stop_event=self.stop_scan_event
+        )
+
+
+        self.state_store = self.open_state_store()
+        self.persister = StatePersister(
+            self.state_store,
+            lambda: self.tracked_shows,
+            self.state_lock,
+            delay=self.config['save_debounce_seconds'],
+            on_error=lambda e: self.log(f"Error saving state: {str(e)}", "error"),
+            on_saved=lambda seconds: self.metrics.observe('save', seconds)
+        )
+        self.load_state()
+        self.rebuild_show_index()
+        self.recalculate_needed_for_all_shows()
+
+    def log(self, message: str, level: str = "info"):
+        """
+        Log a line for the front end. Lines logged by a scan worker are held until its
+        show finishes so that each show's output stays contiguous.
+        """
+        logger.log(logging.ERROR if level == "error" else logging.INFO, message)
+        buffered = getattr(self.scan_log_buffer, 'lines', None)
+        if buffered is not None:
+            buffered.append((message, level))
+            return
+        self.emit_log([(message, level)])
+
+    def emit_log(self, lines: List[Tuple[str, str]]):
+        if self.on_log:
+            self.on_log(lines)
+
+    def set_status(self, text: str):
+        if self.on_status:
+            self.on_status(text)
+
+    def run_scan(self, mode: Optional[str] = None, due_only: bool = False):
+        """
+        Run one scan ('search' or 'feed') on the calling thread; stop_scan() ends it early.
+        With due_only, a search scan only covers shows whose poll interval has elapsed.
+        """
+        self.stop_scan_event.clear()
+        for stats in (self.parse_cache, self.title_parser, self.model_failures,
+                      self.http, self.rate_limits, self.response_cache):
+            stats.reset_stats()
+        self.scan_session = ScanSession()
+        self.metrics = ScanMetrics()
+        self.log("Started scanning shows.", level="info")
+        try:
+            with self.metrics.stage('scan'):
+                if (mode or self.config['scan_mode']) == 'feed':
+                    self.scan_feed()
+                else:
+                    self.scan_shows(due_only)
+        finally:
+            self.flush_state()
+            self.parse_cache.flush()
+            self.metrics.finish()
+            self.write_metrics(mode or self.config['scan_mode'])
+
+    def write_metrics(self, mode: str):
+        """Write the last scan's metrics to metrics_file (JSON) and metrics_prometheus_file."""
+        outputs = [
+            (self.config['metrics_file'], lambda: json.dumps(self.metrics.summary({
+                'mode': mode,
+                'stopped': self.stop_scan_event.is_set(),
+                'http': self.http.host_stats_snapshot()
+            }), indent=2)),
+            (self.config['metrics_prometheus_file'], self.metrics.prometheus)
+        ]
+        for path, render in outputs:
+            if not path:
+                continue
+            try:
+                directory = os.path.dirname(os.path.abspath(path))
+                fd, temp_path = tempfile.mkstemp(prefix=".scan_metrics.", suffix=".tmp", dir=directory)
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    f.write(render())
+                os.replace(temp_path, path)
+            except Exception as e:
+                self.log(f"Error writing scan metrics to {path}: {str(e)}", "error")
+
+    def stop_scan(self):
+        self.stop_scan_event.set()
+
+    def scan_summary(self) -> List[str]:
+        """Statistics of the last scan, ending with how it finished."""
+        lines = [
+            self.title_parser.stats_summary(),
+            self.model_failures.stats_summary(),
+            self.parse_cache.stats_summary(),
+            self.response_cache.stats_summary(),
+            self.scan_session.stats_summary(),
+            self.metrics.stats_summary()
+        ]
+        lines += self.http.stats_summary() + self.rate_limits.stats_summary()
+        if self.stop_scan_event.is_set():
+            lines.append("Scan was stopped by user.")
+        else:
+            lines.append("Scan completed successfully.")
+        return lines
+
+    def close(self):
+        self.flush_state()
+        self.parse_cache.close()
+        self.response_cache.close()
+        self.state_store.close()
+        self.http.close()
+
+    def add_show(self, details: Dict) -> Dict:
+        show = {
+            **details,
+            'id': uuid.uuid4().hex,
+            'downloaded_episodes': EpisodeSet(),
+            'needed_episodes': EpisodeSet(),
+            'last_checked': None,
+            'found_at': [],
+            'idle_scans': 0
+        }
+        with self.state_lock:
+            self.tracked_shows.append(show)
+            self.rebuild_show_index()
+            self.recalculate_needed_for_show(show)
+        self.save_state(show)
+        self.log(f"Added new show: {show['names'][0]}", level="info")
+        return show
+
+    def update_show(self, index: int, details: Dict) -> Dict:
+        """Replace a show's settings, keeping its id and episode state."""
+        with self.state_lock:
+            current = self.tracked_shows[index]
+            show = {
+                **details,
+                'id': current['id'],
+                'downloaded_episodes': current['downloaded_episodes'],
+                'needed_episodes': current['needed_episodes'],
+                'last_checked': current['last_checked'],
+                'found_at': current['found_at'],
+                'idle_scans': current['idle_scans']
+            }
+            self.tracked_shows[index] = show
+            self.rebuild_show_index()
+            self.recalculate_needed_for_show(show)
+        self.save_state(show)
+        self.log(f"Edited show: {show['names'][0]}", level="info")
+        return show
+
+    def remove_show(self, index: int) -> Dict:
+        with self.state_lock:
+            show = self.tracked_shows.pop(index)
+            self.rebuild_show_index()
+        self.save_state()
+        self.log(f"Removed show: {show['names'][0]}", level="info")
+        return show
+
+    def reset_show(self, show: Dict):
+        """Forget every downloaded episode of a show."""
+        with self.state_lock:
+            show['downloaded_episodes'].clear()
+            self.recalculate_needed_for_show(show)
+        self.save_state(show)
+        self.log(f"Show '{show['names'][0]}' has been reset.", level="info")
+
+    def due_shows(self, now: Optional[float] = None) -> List[Dict]:
+        now = time.time() if now is None else now
+        with self.state_lock:
+            return [show for show in self.tracked_shows if self.scheduler.is_due(show, now)]
+
+    def next_poll_time(self) -> Optional[float]:
+        """When the next show becomes due for polling (epoch seconds), or None without shows."""
+        now = time.time()
+        with self.state_lock:
+            return min((self.scheduler.next_due(show, now) for show in self.tracked_shows), default=None)
+
+    def next_feed_poll_time(self) -> float:
+        """When the feed is next due for a check (epoch seconds)."""
+        checked_at = parse_timestamp(self.feed_state.get('checked_at'))
+        return time.time() if checked_at is None else checked_at + self.config['feed_poll_interval']
+
+    def scan_shows(self, due_only: bool = False):
+        """Scan tracked shows (all, or only those due for polling) on a bounded worker pool."""
+        shows = self.due_shows() if due_only else list(self.tracked_shows)
+        if due_only:
+            self.log(f"{len(shows)} of {len(self.tracked_shows)} shows due for polling", level="info")
+        if not shows:
+            return
+        workers = max(1, min(self.config['scan_workers'], len(shows)))
+        self.set_status(f"Scanning {len(shows)} shows...")
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="scan") as pool:
+            futures = {pool.submit(self.scan_show_buffered, show): show for show in shows}
+            completed = 0
+            for future in as_completed(futures):
+                completed += 1
+                try:
+                    future.result()
+                except Exception as e:
+                    self.log(f"Error scanning {futures[future]['names'][0]}: {str(e)}", level="error")
+                if not self.stop_scan_event.is_set():
+                    self.set_status(f"Scanned {completed}/{len(shows)} shows...")
+
+        if self.stop_scan_event.is_set():
+            self.log("Scan stopped by user.", level="info")
+
+    def scan_show_buffered(self, show: Dict):
+        """Run scan_show on a worker thread, then emit its log lines as one block."""
+        self.scan_log_buffer.lines = []
+        try:
+            with self.metrics.bind_show(show['names'][0]), self.metrics.stage('show'):
+                self.scan_show(show)
+        finally:
+            lines = self.scan_log_buffer.lines
+            self.scan_log_buffer.lines = None
+            if lines:
+                self.emit_log(lines)
+
+    SEASON_BATCH, EPISODE = 0, 1
+
+    def plan_searches(self, show: Dict, needed: EpisodeSet) -> List[Tuple[int, int, int]]:
+        """
+        Work queue (a heap) of (season, kind, episode) searches for a show's needed episodes.
+        Seasons missing at least batch_search_threshold of their tracked episodes get a
+        SEASON_BATCH search, which sorts ahead of that season's EPISODE searches.
+        """
+        queue = []
+        threshold = self.config['batch_search_threshold']
+        for season, first, last in self.tracking_ranges(show):
+            missing = len(needed.season_episodes(season))
+            if missing >= 2 and missing >= threshold * (last - first + 1):
+                heapq.heappush(queue, (season, self.SEASON_BATCH, 0))
+        for season, episode in needed:
+            heapq.heappush(queue, (season, self.EPISODE, episode))
+        return queue
+
+    def scan_show(self, show: Dict):
+        if self.stop_scan_event.is_set():
+            return
+
+        self.log(f"=== Scanning Show: {show['names'][0]} ===", level="info")
+
+        with self.state_lock:
+            queue = self.plan_searches(show, show['needed_episodes'].copy())
+            downloaded_before = len(show['downloaded_episodes'])
+        self.scan_pass.failed_requests = 0
+
+        while queue:
+            season, kind, episode = heapq.heappop(queue)
+            if self.stop_scan_event.is_set():
+                self.log("Scan stopped by user.", level="info")
+                return
+
+            with self.state_lock:
+                if kind == self.SEASON_BATCH:
+                    missing = show['needed_episodes'].season_episodes(season)
+                    if len(missing) < 2:
+                        continue
+                # A batch found earlier in this pass may already cover this episode.
+                elif (season, episode) not in show['needed_episodes']:
+                    continue
+
+            if kind == self.SEASON_BATCH:
+                self.log(f"  Checking Season Batch: S{season:02d} ({len(missing)} episodes missing)", level="info")
+                with self.metrics.stage('search_season_batch'):
+                    found = self.search_season_batch(show, season, missing)
+                if not found:
+                    self.log(f"  No season batch found for {show['names'][0]} S{season:02d}; searching episodes", level="info")
+                continue
+
+            self.log(f"  Checking Episode: S{season:02d}E{episode:02d}", level="info")
+            with self.metrics.stage('search_episode'):
+                found = self.search_episode(show, season, episode)
+            if not found:
+                self.log(f"  Episode not found for {show['names'][0]} at S{season:02d}E{episode:02d}", level="info")
+                # Assume later episodes are not out yet.
+                break
+
+        with self.state_lock:
+            show['last_checked'] = current_timestamp()
+            if self.scan_pass.failed_requests:
+                # "Nothing found" is not evidence when searches failed; don't back off for it.
+                self.log(f"  {self.scan_pass.failed_requests} searches failed; not counting this scan as idle", level="info")
+            elif len(show['downloaded_episodes']) == downloaded_before:
+                show['idle_scans'] = show.get('idle_scans', 0) + 1
+            self.save_state(show)
+
+    def absolute_episode_for(self, show: Dict, season: int, episode: int) -> int:
+        catalog_name = next((name for name in show['names'] if name in self.catalog), None)
+        return self.catalog.absolute_episode(catalog_name, season, episode) if catalog_name else episode
+
+    def search_episode(self, show: Dict, season: int, episode: int) -> bool:
+        queries = []
+        for name in show['names']:
+            queries.extend([
+                f"{name} S{season:02d}E{episode:02d} {show['quality']}",
+                f"{name} S{season} - {episode:02d} {show['quality']}"
+            ])
+        absolute = self.absolute_episode_for(show, season, episode)
+        candidate_filter = CandidateFilter(show['names'], show['quality'], season, episode, absolute)
+        return self.search_releases(
+            show, queries, candidate_filter, {(season, episode)},
+            lambda parsed: self.is_valid_episode(show, season, episode, parsed)
+        )
+
+    def search_season_batch(self, show: Dict, season: int, missing: List[int]) -> bool:
+        """Look for one release covering the missing episodes of a season."""
+        queries = []
+        for name in show['names']:
+            queries.extend([
+                f"{name} S{season:02d} {show['quality']}",
+                f"{name} {show['quality']} batch"
+            ])
+        absolute = self.absolute_episode_for(show, season, missing[0])
+        candidate_filter = CandidateFilter(show['names'], show['quality'], season, missing[0], absolute, batch_only=True)
+        return self.search_releases(
+            show, queries, candidate_filter, {(season, episode) for episode in missing},
+            lambda parsed: self.is_valid_season_batch(show, season, missing, parsed)
+        )
+
+    def search_releases(self, show: Dict, queries: List[str], candidate_filter: CandidateFilter,
+                        targets: Set[Tuple[int, int]], accept) -> bool:
+        """
+        Run queries in order until a release passing accept(parsed) covers one of the
+        target episodes; its episodes are then marked downloaded and its magnet opened.
+        """
+        if self.stop_scan_event.is_set():
+            return False
+        window = max(1, self.config['candidate_parse_window'])
+
+        for query in queries:
+            if self.stop_scan_event.is_set():
+                self.log("Scan stopped by user during search.", level="info")
+                return False
+
+            self.log(f"   Trying search query: {query}", level="info")
+            params = {
+                'f': 0,
+                'c': '0_0',
+                'q': query,
+                's': 'seeders',
+                'o': 'desc'
+            }
+
+            try:
+                rows = self.fetch_search_rows(params)
+                candidates = candidate_filter.rank(rows)
+                self.metrics.add('queries')
+                self.metrics.add('rows_seen', len(rows))
+                self.metrics.add('candidates', len(candidates))
+                debug_log(f"Pre-filter kept {len(candidates)} of {len(rows)} rows for query '{query}'")
+                kept = {id(row) for row in candidates}
+                self.credit_other_shows(show, [row for row in rows if id(row) not in kept])
+
+                # Parse the best candidates first, a small window at a time, and stop at the first match.
+                for start in range(0, len(candidates), window):
+                    chunk = candidates[start:start + window]
+                    with self.metrics.stage('parse'):
+                        parsed_rows = self.parse_rows(chunk)
+
+                    for row, parsed in zip(chunk, parsed_rows):
+                        title, magnet = row['title'], row['magnet']
+                        if self.stop_scan_event.is_set():
+                            self.log("Scan stopped by user during torrent processing.", level="info")
+                            return False
+
+                        if parsed is None:
+                            continue
+
+                        try:
+                            debug_log(f"Parsed title: {parsed}")
+
+                            if accept(parsed):
+                                with self.state_lock:
+                                    if not any(target in show['needed_episodes'] for target in targets):
+                                        # Already credited from another show's search meanwhile.
+                                        return True
+                                    newly_downloaded = self.mark_downloaded(show, self.parsed_episodes(parsed))
+                                    self.save_state(show)
+
+                                self.log(f"    Match Found: {title}", level="success")
+                                if parsed.get('is_batch'):
+                                    self.log(f"     Batch Episodes Downloaded: {newly_downloaded}", level="success")
+                                self.open_magnet(magnet, title)
+                                return True
+
+                            # A release of another tracked show still counts towards that show.
+                            self.credit_parsed_release(parsed, title, magnet, exclude=show)
+
+                        except Exception as e:
+                            debug_log(f"Error processing torrent for title '{title}': {str(e)}")
+                            continue
+
+            except requests.RequestException as e:
+                self.scan_pass.failed_requests = getattr(self.scan_pass, 'failed_requests', 0) + 1
+                self.log(f"   Search failed for query '{query}': {str(e)}", level="error")
+            except Exception as e:
+                debug_log(f"Search query failed for query '{query}': {str(e)}")
+
+        return False
+
+    def mark_downloaded(self, show: Dict, episodes) -> List[Tuple[int, int]]:
+        """
+        Move the given (season, episode) pairs from needed to downloaded.
+        Returns the pairs that were actually needed. Callers hold state_lock.
+        """
+        newly_downloaded = []
+        for season, episode in episodes:
+            if (season, episode) in show['needed_episodes']:
+                show['needed_episodes'].discard(season, episode)
+                show['downloaded_episodes'].add(season, episode)
+                newly_downloaded.append((season, episode))
+        newly_downloaded.sort()
+        if newly_downloaded:
+            # Release history drives the show's polling cadence. Finds within poll_min_interval
+            # of the last one (the same scan, or a backlog catch-up) replace it.
+            found_at = show.get('found_at', [])
+            last_found = parse_timestamp(found_at[-1]) if found_at else None
+            if last_found is not None and time.time() - last_found < self.config['poll_min_interval']:
+                found_at = found_at[:-1]
+            show['found_at'] = (found_at + [current_timestamp()])[-self.config['poll_history']:]
+            show['idle_scans'] = 0
+            if self.on_episodes_changed:
+                self.on_episodes_changed(show, newly_downloaded)
+        return newly_downloaded
+
+    def parsed_episodes(self, parsed: Dict) -> List[Tuple[int, int]]:
+        """The (season, episode) pairs a parsed release provides."""
+        if parsed.get('is_batch'):
+            return sorted(self.get_batch_episodes(parsed))
+        if parsed.get('episode') is None:
+            return []
+        return [(parsed['season'], parsed['episode'])]
+
+    def credit_parsed_release(self, parsed: Dict, title: str, magnet: str, exclude: Optional[Dict] = None) -> bool:
+        """
+        Credit a parsed release to the tracked show it resolves to, as long as that show
+        still needs at least one of its episodes. When a show is tracked more than once,
+        the entry with the release's quality that needs its episodes is chosen.
+        Returns True if it was credited.
+        """
+        candidates = [
+            show for show in self.show_index.resolve(parsed.get('show', ""))
+            if show is not exclude and parsed.get('quality') == show.get('quality')
+        ]
+        if not candidates:
+            return False
+        episodes = self.parsed_episodes(parsed)
+        with self.state_lock:
+            show = next((show for show in candidates if any(pair in show['needed_episodes'] for pair in episodes)), None)
+            if show is None:
+                return False
+            newly_downloaded = self.mark_downloaded(show, episodes)
+            if not newly_downloaded:
+                return False
+            self.save_state(show)
+        self.log(f"    Match Found for {show['names'][0]}: {title}", level="success")
+        self.log(f"     Episodes Downloaded: {newly_downloaded}", level="success")
+        self.open_magnet(magnet, title)
+        return True
+
+    def credit_other_shows(self, show: Dict, rows: List[Dict]):
+        """
+        Credit search rows the pre-filter dropped to other tracked shows they belong to.
+        Only the local parser is used, so this never costs a model request.
+        """
+        for row in rows:
+            if not self.show_index.mentioned_in(row['title']):
+                continue
+            parsed = self.scan_session.get(row)
+            if parsed is None:
+                parsed = self.fast_parse_title(row['title'])
+                if parsed is None:
+                    continue
+                self.scan_session.put(row, parsed)
+            try:
+                self.credit_parsed_release(parsed, row['title'], row['magnet'], exclude=show)
+            except Exception as e:
+                debug_log(f"Error crediting title '{row['title']}': {str(e)}")
+
+    def open_magnet(self, magnet: str, title: str):
+        """Deliver a matched release's magnet to the sink, once per torrent per scan."""
+        if not self.scan_session.claim_magnet(magnet):
+            return
+        try:
+            self.sink.send(magnet, title)
+        except Exception as e:
+            self.log(f"    Failed to deliver magnet for {title}: {str(e)}", "error")
+
+    def scan_feed(self):
+        """
+        Feed mode: fetch the latest uploads once, skip everything at or below the stored
+        high-water mark, and match the new uploads against every tracked show's needs.
+        Uploads whose titles failed to parse are retried on the next feed_parse_retries checks.
+        """
+        self.log("=== Scanning recent uploads feed ===", level="info")
+        self.set_status("Checking recent uploads...")
+        self.feed_state['checked_at'] = current_timestamp()
+        try:
+            with self.metrics.stage('fetch'):
+                response = self.http.get(self.config['nyaa_url'], params=self.config['feed_params'])
+            self.metrics.add('bytes_received', len(response.content))
+            response.raise_for_status()
+            items = parse_feed_items(response.content, self.config['feed_trackers'])[:self.config['feed_limit']]
+        except Exception as e:
+            self.log(f"  Feed request failed: {str(e)}", level="error")
+            return
+
+        last_seen_id = self.feed_state.get('last_seen_id', 0)
+        # JSON object keys are strings; upload id -> failed parse attempts so far.
+        retries = {int(item_id): attempts for item_id, attempts in self.feed_state.get('retry_ids', {}).items()}
+        fresh_items = [item for item in items if item['id'] > last_seen_id]
+        if items and fresh_items and fresh_items[-1] is items[-1] and last_seen_id:
+            self.log("  Feed window exceeded since the last check; some uploads may have been missed.", level="error")
+        self.log(f"  {len(fresh_items)} new uploads since last check", level="info")
+        new_items = [item for item in items if item['id'] > last_seen_id or item['id'] in retries]
+        if not new_items:
+            return
+
+        # Most uploads are of shows nobody tracks; don't spend parses (or model tokens) on them.
+        relevant = [item for item in new_items if self.show_index.mentioned_in(item['title'])]
+        debug_log(f"{len(relevant)} of {len(new_items)} feed uploads mention a tracked show")
+        with self.metrics.stage('parse'):
+            parsed_items = self.parse_titles([item['title'] for item in relevant])
+        if self.stop_scan_event.is_set():
+            return
+
+        failed = {}
+        for item, parsed in zip(relevant, parsed_items):
+            if parsed is not None:
+                self.credit_parsed_release(parsed, item['title'], item['magnet'])
+                continue
+            attempts = retries.get(item['id'], 0) + 1
+            if attempts < self.config['feed_parse_retries']:
+                failed[str(item['id'])] = attempts
+            else:
+                debug_log(f"Giving up on feed upload {item['id']} after {attempts} failed parses: {item['title']}")
+
+        self.feed_state = {
+            'last_seen_id': max(last_seen_id, new_items[0]['id']),
+            'last_pub_date': fresh_items[0]['pub_date'] if fresh_items else self.feed_state.get('last_pub_date'),
+            'retry_ids': failed,
+            'checked_at': self.feed_state['checked_at']
+        }
+        self.save_feed_state()
+
+    def load_feed_state(self) -> Dict:
+        try:
+            with open(self.config['feed_state_file']) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            debug_log(f"Error loading feed state: {str(e)}")
+            return {}
+
+    def save_feed_state(self):
+        try:
+            with open(self.config['feed_state_file'], 'w') as f:
+                json.dump(self.feed_state, f, indent=2)
+        except Exception as e:
+            self.log(f"Error saving feed state: {str(e)}", "error")
+
+    def fetch_search_rows(self, params: Dict) -> List[Dict]:
+        """
+        Fetch the result rows for a nyaa search, going through the response cache:
+        fresh entries are served without a request, stale ones are revalidated with a
+        conditional GET, and bodies whose hash is unchanged are not re-parsed.
+        """
+        url = self.config['nyaa_url']
+        key = ResponseCache.make_key(url, params)
+        cached = self.response_cache.get(key)
+        if cached and cached['fresh']:
+            self.response_cache.record('fresh')
+            self.metrics.add('response_cache_fresh')
+            return cached['rows']
+
+        headers = {}
+        if cached:
+            if cached['etag']:
+                headers['If-None-Match'] = cached['etag']
+            if cached['last_modified']:
+                headers['If-Modified-Since'] = cached['last_modified']
+
+        with self.metrics.stage('fetch'):
+            response = self.http.get(url, params=params, headers=headers)
+        self.metrics.add('bytes_received', len(response.content))
+        if response.status_code == 304 and cached:
+            self.response_cache.touch(key)
+            self.response_cache.record('not_modified', len(response.content))
+            self.metrics.add('response_cache_not_modified')
+            return cached['rows']
+        response.raise_for_status()
+
+        body_hash = hashlib.sha1(response.content).hexdigest()
+        if cached and cached['body_hash'] == body_hash:
+            self.response_cache.touch(key)
+            self.response_cache.record('unchanged', len(response.content))
+            self.metrics.add('response_cache_unchanged')
+            return cached['rows']
+
+        with self.metrics.stage('extract'):
+            rows = extract_result_rows(response.text)
+        self.response_cache.put(key, response.headers.get('ETag'), response.headers.get('Last-Modified'), body_hash, rows)
+        self.response_cache.record('parsed', len(response.content))
+        self.metrics.add('response_cache_parsed')
+        return rows
+
+    def calculate_absolute_episode(self, show_name: str, season: int, episode: int) -> int:
+        return self.catalog.absolute_episode(show_name, season, episode)
+
+    def load_known_shows(self) -> Dict:
+        try:
+            with open(self.config['known_shows_file']) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            self.log(f"Error loading known shows: {str(e)}", "error")
+            return {}
+
+    def update_known_shows(self, updated_shows: Dict):
+        """Replace the known shows, rebuild everything derived from them and write the file."""
+        with self.state_lock:
+            self.known_shows = updated_shows
+            self.catalog = KnownShows(self.known_shows)
+            self._parse_context = None
+            self._prompt_cache = {}
+            self.rebuild_show_index()
+        with open(self.config['known_shows_file'], 'w') as f:
+            json.dump(self.known_shows, f, indent=2)
+        self.recalculate_needed_for_all_shows()
+
+    def open_state_store(self):
+        if self.config['state_backend'] != 'sqlite':
+            return JsonStateStore(self.config['state_file'])
+        store = SqliteStateStore(self.config['state_db_file'])
+        try:
+            imported = store.import_json(self.config['state_file'])
+            if imported:
+                self.log(f"Imported {imported} shows from {self.config['state_file']}.", "info")
+        except Exception as e:
+            self.log(f"Error importing {self.config['state_file']}: {str(e)}", "error")
+        return store
+
+    def load_state(self):
+        try:
+            data = self.state_store.load()
+            if not data:
+                self.tracked_shows = []
+                self.log("No tracked shows found. Starting fresh.", "info")
+                return
+
+            for show in data:
+                show.setdefault('id', uuid.uuid4().hex)
+                show.setdefault('last_checked', None)
+                show.setdefault('quality', '1080p')
+                show.setdefault('names', [])
+                show.setdefault('start_season', 1)
+                show.setdefault('start_episode', 1)
+                show.setdefault('end_season', 1)
+                show.setdefault('end_episode', 12)
+                show.setdefault('found_at', [])
+                show.setdefault('idle_scans', 0)
+
+            self.tracked_shows = data
+            self.log("Loaded tracked shows successfully.", "info")
+        except json.decoder.JSONDecodeError as e:
+            self.tracked_shows = []
+            self.log("Error loading state: Invalid JSON format. Starting fresh.", "error")
+        except Exception as e:
+            self.tracked_shows = []
+            self.log(f"Error loading state: {str(e)}", "error")
+
+    def save_state(self, show: Optional[Dict] = None):
+        """Schedule a save of one changed show, or of every show when none is given."""
+        self.persister.mark_dirty(show['id'] if show else None)
+
+    def flush_state(self):
+        """Write pending state changes now."""
+        self.persister.flush()
+
+    def recalculate_needed_for_all_shows(self):
+        """Recompute needed episodes for shows whose inputs changed and save only those."""
+        with self.state_lock:
+            changed = [show for show in self.tracked_shows if self.recalculate_needed_for_show(show)]
+        for show in changed:
+            self.save_state(show)
+        debug_log(f"Recalculated needed episodes: {len(changed)} of {len(self.tracked_shows)} shows changed")
+
+    def needed_signature(self, show: Dict) -> Tuple:
+        """Everything the needed set of a show is derived from."""
+        return (
+            show['start_season'], show['start_episode'], show['end_season'], show['end_episode'],
+            self.catalog.signature(show['names'][0]),
+            tuple(sorted(show['downloaded_episodes'].seasons.items()))
+        )
+
+    def tracking_ranges(self, show: Dict) -> List[Tuple[int, int, int]]:
+        """The (season, first_episode, last_episode) ranges covered by a show's tracking range."""
+        ranges = []
+        show_name = show['names'][0]
+        start_season = show['start_season']
+        end_season = show['end_season']
+        start_episode = show['start_episode']
+        end_episode = show['end_episode']
+
+        for season in range(start_season, end_season + 1):
+            eps_per_season = self.catalog.episodes_in_season(show_name, season)
+            if eps_per_season is not None:
+                current_start_ep = start_episode if season == start_season else 1
+                current_end_ep = end_episode if season == end_season else eps_per_season
+                current_end_ep = min(current_end_ep, eps_per_season)
+            else:
+                current_start_ep = start_episode if season == start_season else 1
+                current_end_ep = end_episode
+
+            current_start_ep = max(1, current_start_ep)
+            current_end_ep = max(current_start_ep, current_end_ep)
+            ranges.append((season, current_start_ep, current_end_ep))
+        return ranges
+
+    def recalculate_needed_for_show(self, show: Dict) -> bool:
+        """
+        Recompute a show's needed episodes as its tracking range minus downloaded episodes.
+        Skipped when nothing it depends on changed since the last run; returns True if the
+        needed set changed.
+        """
+        try:
+            signature = self.needed_signature(show)
+            if self.needed_signatures.get(show['id']) == signature:
+                return False
+
+            needed = EpisodeSet()
+            for season, first, last in self.tracking_ranges(show):
+                needed.add_range(season, first, last)
+            needed.difference_update(show['downloaded_episodes'])
+            self.needed_signatures[show['id']] = signature
+
+            if needed == show['needed_episodes']:
+                return False
+            show['needed_episodes'] = needed
+            return True
+
+        except Exception as e:
+            self.log(f"Error recalculating episodes for {show['names'][0]}: {str(e)}", "error")
+            return False
+
+    def get_batch_episodes(self, parsed: Dict) -> Set[Tuple[int, int]]:
+        """The episodes a batch holds: its explicit range if given, else the whole season."""
+        season = parsed['season']
+        if parsed.get('batch_episodes'):
+            return {(season, ep) for ep in parsed['batch_episodes']}
+        eps_per_season = self.catalog.episodes_in_season(parsed.get('show', ""), season)
+        if eps_per_season is None:
+            eps_per_season = KnownShows.DEFAULT_EPISODES
+        return {(season, ep) for ep in range(1, eps_per_season + 1)}
+
+    def rebuild_show_index(self):
+        with self.state_lock:
+            self.show_index = ShowIndex(self.tracked_shows, self.catalog.names())
+
+    def is_valid_season_batch(self, show: Dict, season: int, missing: List[int], parsed: Dict) -> bool:
+        if not parsed.get('is_batch') or parsed.get('season') != season:
+            return False
+        batch_episodes = self.get_batch_episodes(parsed)
+        if not any((season, episode) in batch_episodes for episode in missing):
+            return False
+        return self.show_index.matches(parsed.get('show', ""), show) and parsed.get('quality') == show.get('quality')
+
+    def is_valid_episode(self, show: Dict, target_season: int, target_episode: int, parsed: Dict) -> bool:
+        if not self.show_index.matches(parsed.get('show', ""), show):
+            return False
+
+        if parsed.get('quality') != show.get('quality'):
+            return False
+
+        if parsed.get('is_batch'):
+            batch_episodes = self.get_batch_episodes(parsed)
+            return (target_season, target_episode) in batch_episodes
+        else:
+            return parsed.get('season') == target_season and parsed.get('episode') == target_episode
+
+    def parse_context_key(self) -> str:
+        """Fingerprint of everything besides the title that influences parse_title output."""
+        if self._parse_context is None:
+            payload = json.dumps({'known_shows': self.known_shows, 'model': self.config['openai_model']}, sort_keys=True)
+            self._parse_context = hashlib.sha1(payload.encode('utf-8')).hexdigest()
+        return self._parse_context
+
+    def fast_parse_title(self, title: str) -> Optional[Dict]:
+        """Parse a title with the local regex parser, or return None if the model is needed."""
+        match = self.title_parser.parse(title)
+        if match is None:
+            return None
+        pattern_name, parsed = match
+        if self.show_index.near_miss(parsed['show']):
+            # Close to a tracked name but not equal to it, e.g. a sequel; let the model decide.
+            return None
+        parsed['show'] = self.show_index.canonical_name(parsed['show'])
+        if parsed['season'] is None:
+            # Without a season marker numbers may be absolute; map them through the catalog.
+            # A known show whose numbers don't map onto a single season goes to the model.
+            parsed['season'] = 1
+            known = parsed['show'] in self.catalog
+            if parsed['episode'] is not None:
+                mapped = self.catalog.season_episode(parsed['show'], parsed['episode'])
+                if mapped:
+                    parsed['season'], parsed['episode'] = mapped
+                elif known:
+                    return None
+            elif parsed['batch_episodes']:
+                first = self.catalog.season_episode(parsed['show'], parsed['batch_episodes'][0])
+                last = self.catalog.season_episode(parsed['show'], parsed['batch_episodes'][-1])
+                if first and last and first[0] == last[0]:
+                    parsed['season'] = first[0]
+                    parsed['batch_episodes'] = list(range(first[1], last[1] + 1))
+                elif known:
+                    return None
+        self.title_parser.record(pattern_name)
+        return parsed
+
+    def parse_title(self, title: str) -> Dict:
+        """
+        Parse a torrent title locally when it follows a known layout, otherwise via the
+        model, serving repeat titles from the persistent parse cache.
+        """
+        parsed = self.fast_parse_title(title)
+        if parsed is not None:
+            debug_log(f"Parsed title locally: {title}")
+            self.metrics.add('titles_local')
+            return parsed
+        self.title_parser.record('model')
+
+        context = self.parse_context_key()
+        cached = self.parse_cache.get(title, context)
+        if cached is not None:
+            debug_log(f"Parse cache hit for title: {title}")
+            self.metrics.add('parse_cache_hits')
+            return cached
+        self.metrics.add('parse_cache_misses')
+        result = self.parse_title_with_model(title)
+        self.parse_cache.put(title, context, result)
+        return result
+
+    def parse_titles(self, titles: List[str]) -> List[Optional[Dict]]:
+        """
+        Parse a page of torrent titles, returning results in the same order.
+        Titles the local parser and cache can't answer are sent to the model in batched
+        requests; entries that fail to parse come back as None.
+        """
+        results: List[Optional[Dict]] = [None] * len(titles)
+        context = self.parse_context_key()
+        pending: Dict[str, List[int]] = {}
+
+        for index, title in enumerate(titles):
+            if title in pending:
+                pending[title].append(index)
+                continue
+            parsed = self.fast_parse_title(title)
+            if parsed is None:
+                parsed = self.parse_cache.get(title, context)
+                if parsed is None:
+                    pending[title] = [index]
+                    self.title_parser.record('model')
+                    self.metrics.add('parse_cache_misses')
+                    continue
+                self.metrics.add('parse_cache_hits')
+            else:
+                self.metrics.add('titles_local')
+            results[index] = parsed
+
+        pending_titles = list(pending.keys())
+        batch_size = max(1, self.config['parse_batch_size'])
+        for start in range(0, len(pending_titles), batch_size):
+            chunk = pending_titles[start:start + batch_size]
+            try:
+                parsed_chunk = self.parse_titles_with_model(chunk)
+            except Exception as e:
+                debug_log(f"Batch parse failed for {len(chunk)} titles: {str(e)}")
+                continue
+            for title, parsed in zip(chunk, parsed_chunk):
+                if parsed is None:
+                    continue
+                self.parse_cache.put(title, context, parsed)
+                for index in pending[title]:
+                    results[index] = dict(parsed)
+
+        return results
+
+    def parse_rows(self, rows: List[Dict]) -> List[Optional[Dict]]:
+        """parse_titles for search rows, reusing the parse of any torrent already seen this scan."""
+        session = self.scan_session
+        results = [session.get(row) for row in rows]
+        missing = [index for index, parsed in enumerate(results) if parsed is None]
+        self.metrics.add('rows_reused', len(rows) - len(missing))
+        self.metrics.add('rows_parsed', len(missing))
+        if missing:
+            for index, parsed in zip(missing, self.parse_titles([rows[index]['title'] for index in missing])):
+                results[index] = parsed
+                if parsed is not None:
+                    session.put(rows[index], parsed)
+        return results
+
+    PROMPT_CACHE_SIZE = 1024
+
+    def build_parse_system_prompt(self, titles: List[str]) -> str:
+        """
+        System prompt for parsing the given titles. Only the known-shows entries whose
+        names appear in the titles are included (as compact JSON), so the prompt stays
+        small however large the catalog grows. Prompts are cached until known shows change.
+        """
+        relevant = frozenset(name for title in titles for name in self.catalog.names_in_title(title))
+        prompt = self._prompt_cache.get(relevant)
+        if prompt is not None:
+            return prompt
+
+        rules = {name: self.known_shows[name] for name in sorted(relevant)}
+        prompt = f"""Extract anime metadata as JSON with:
+- show: normalized title
+- season: number
+- episode: number (null if batch)
+- is_batch: boolean
+- quality: string
+- batch_episodes: array of episode numbers (if batch)
+Rules for {json.dumps(rules, separators=(',', ':'), ensure_ascii=False)}
+If season markers are missing, derive season based on episode counts."""
+        if len(self._prompt_cache) >= self.PROMPT_CACHE_SIZE:
+            self._prompt_cache = {}
+        self._prompt_cache[relevant] = prompt
+        return prompt
+
+    def get_openai_client(self) -> OpenAI:
+        """
+        The shared OpenAI client, created on first use. The SDK's own retries are off so
+        that every 429 reaches create_chat_completion and slows the rate buckets.
+        """
+        with self._openai_client_lock:
+            if self._openai_client is None:
+                self._openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
+            return self._openai_client
+
+    def create_chat_completion(self, messages: List[Dict], response_format: Optional[Dict] = None):
+        """
+        Send a chat completion request, paced by the per-model request and token buckets.
+        A rate limit error slows the buckets down for every scan worker, and the request is
+        retried through them; connection and server errors are retried with backoff. After
+        openai_max_retries retries the last error is raised.
+        """
+        model = self.config['openai_model']
+        request_bucket = self.rate_limits.bucket(f"openai:{model}")
+        token_bucket = self.rate_limits.bucket(f"openai_tokens:{model}")
+        # Rough prompt size estimate (~4 characters per token) for TPM pacing.
+        estimated_tokens = sum(len(message['content']) for message in messages) / 4
+        extra = {'response_format': response_format} if response_format else {}
+        client = self.get_openai_client()
+
+        for attempt in range(self.config['openai_max_retries'] + 1):
+            if not (request_bucket.acquire(stop_event=self.stop_scan_event)
+                    and token_bucket.acquire(estimated_tokens, stop_event=self.stop_scan_event)):
+                raise RuntimeError("Model request abandoned: scan stopped")
+            try:
+                with self.request_limiter.limit(self.config['openai_url']), self.metrics.stage('model'):
+                    response = client.chat.completions.create(
+                        model=model,
+                        messages=messages,
+                        temperature=0.1,
+                        **extra
+                    )
+                break
+            except RateLimitError:
+                request_bucket.penalize()
+                token_bucket.penalize()
+                self.metrics.add('model_rate_limited')
+                if attempt == self.config['openai_max_retries']:
+                    raise
+            except (APIConnectionError, InternalServerError):
+                self.metrics.add('model_retries')
+                if attempt == self.config['openai_max_retries']:
+                    raise
+                delay = min(self.config['http_backoff_max'], self.config['http_backoff_base'] * (2 ** attempt))
+                if self.stop_scan_event.wait(delay):
+                    raise RuntimeError("Model request abandoned: scan stopped")
+        request_bucket.reward()
+        token_bucket.reward()
+        self.metrics.add('model_requests')
+        usage = getattr(response, 'usage', None)
+        if usage is not None:
+            self.metrics.add('model_prompt_tokens', usage.prompt_tokens or 0)
+            self.metrics.add('model_completion_tokens', usage.completion_tokens or 0)
+            self.metrics.add('model_total_tokens', usage.total_tokens or 0)
+        return response
+
+    def request_model_json(self, messages: List[Dict], schema_name: str, schema: Dict):
+        """
+        Ask the model for JSON matching schema (enforced server-side when
+        openai_structured_output is on) and decode the reply.
+        Every failure is raised as a ModelOutputError tagged with its kind.
+        """
+        response_format = None
+        if self.config['openai_structured_output']:
+            response_format = {
+                'type': 'json_schema',
+                'json_schema': {'name': schema_name, 'strict': True, 'schema': schema}
+            }
+        try:
+            response = self.create_chat_completion(messages, response_format)
+        except Exception as e:
+            raise ModelOutputError('api_error', str(e))
+        message = response.choices[0].message
+        if getattr(message, 'refusal', None):
+            raise ModelOutputError('refusal', message.refusal)
+        if not message.content:
+            raise ModelOutputError('empty', "no content in reply")
+        debug_log(f"Raw {schema_name} response: {message.content}")
+        try:
+            return message.content, load_model_json(message.content)
+        except ModelOutputError as e:
+            e.reply = message.content
+            raise
+
+    def repair_model_json(self, reply: str, error: ModelOutputError, schema_name: str, schema: Dict):
+        """Re-ask once with just the faulty reply and the validation error."""
+        debug_log(f"Re-asking for {schema_name} after {error}")
+        _, data = self.request_model_json([
+            {"role": "system", "content": "Fix the JSON so it matches the schema. Change nothing else. Reply with JSON only."},
+            {"role": "user", "content": f"Error: {error}\nJSON: {reply}"}
+        ], schema_name, schema)
+        return data
+
+    def parse_titles_with_model(self, titles: List[str]) -> List[Optional[ParsedTitle]]:
+        """
+        Parse several titles with a single OpenAI request.
+        Results are matched to titles by their echoed index; titles without a result come
+        back as None. Each result is validated independently; invalid ones are re-asked
+        once together.
+        """
+        system_prompt = self.build_parse_system_prompt(titles) + f"""
+You will receive a JSON array of {len(titles)} objects, each with an index and a torrent title.
+Respond with an object whose "results" array holds one object per title, each including that title's index."""
+        debug_log(f"Batch parsing {len(titles)} titles")
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": json.dumps(
+                [{'index': index, 'title': title} for index, title in enumerate(titles)], ensure_ascii=False)}
+        ]
+        try:
+            raw_response, data = self.request_model_json(messages, 'parsed_titles', PARSED_BATCH_SCHEMA)
+            items = self.batch_items(data, raw_response)
+        except ModelOutputError as e:
+            self.model_failures.record(e.kind)
+            if not e.repairable:
+                raise
+            try:
+                items = self.batch_items(self.repair_model_json(e.reply, e, 'parsed_titles', PARSED_BATCH_SCHEMA))
+            except ModelOutputError as repair_error:
+                self.model_failures.record(repair_error.kind)
+                self.model_failures.record_repair(False)
+                raise
+            self.model_failures.record_repair(True)
+        aligned = self.align_batch_items(items, range(len(titles)))
+        if len(aligned) != len(titles) or len(items) != len(titles):
+            self.model_failures.record('count_mismatch')
+            debug_log(f"Batch response has {len(items)} items ({len(aligned)} usable) for {len(titles)} titles")
+
+        results: List[Optional[ParsedTitle]] = [None] * len(titles)
+        invalid: List[Tuple[int, object, ModelOutputError]] = []
+        for index, item in sorted(aligned.items()):
+            try:
+                results[index] = validate_parsed_title(item)
+            except ModelOutputError as e:
+                self.model_failures.record(e.kind)
+                invalid.append((index, item, e))
+
+        if invalid:
+            repairs = self.repair_batch_items(invalid)
+            for index, repaired in repairs.items():
+                results[index] = repaired
+        return results
+
+    @staticmethod
+    def batch_items(data, reply: Optional[str] = None) -> List:
+        if not isinstance(data, dict) or not isinstance(data.get('results'), list):
+            raise ModelOutputError('not_object', 'expected {"results": [...]}', reply)
+        return data['results']
+
+    @staticmethod
+    def align_batch_items(items: List, wanted) -> Dict[int, Dict]:
+        """
+        Batch reply items keyed by their echoed index. Items whose index is missing,
+        not among wanted or repeated are dropped rather than guessed at.
+        """
+        aligned: Dict[int, Dict] = {}
+        repeated: Set[int] = set()
+        for item in items:
+            index = item.get('index') if isinstance(item, dict) else None
+            if not isinstance(index, int) or isinstance(index, bool) or index not in wanted:
+                continue
+            if index in aligned:
+                repeated.add(index)
+            aligned[index] = item
+        for index in repeated:
+            del aligned[index]
+        return aligned
+
+    def repair_batch_items(self, invalid: List[Tuple[int, object, ModelOutputError]]) -> Dict[int, ParsedTitle]:
+        """One repair request for every invalid batch item; returns the ones that now validate."""
+        reply = json.dumps({'results': [item for _, item, _ in invalid]}, ensure_ascii=False)
+        errors = "; ".join(f"index {index}: {error}" for index, _, error in invalid)
+        try:
+            items = self.batch_items(self.repair_model_json(
+                reply, ModelOutputError(invalid[0][2].kind, errors), 'parsed_titles', PARSED_BATCH_SCHEMA))
+        except ModelOutputError as e:
+            self.model_failures.record(e.kind)
+            self.model_failures.record_repair(False)
+            return {}
+
+        repaired: Dict[int, ParsedTitle] = {}
+        for index, item in self.align_batch_items(items, {index for index, _, _ in invalid}).items():
+            try:
+                repaired[index] = validate_parsed_title(item)
+            except ModelOutputError as e:
+                self.model_failures.record(e.kind)
+        self.model_failures.record_repair(len(repaired) == len(invalid))
+        return repaired
+
+    def parse_title_with_model(self, title: str) -> ParsedTitle:
+        """
+        Parse a torrent title using OpenAI's API.
+        A reply that fails validation is re-asked once before giving up.
+        """
+        system_prompt = self.build_parse_system_prompt([title])
+        debug_log(f"Parsing title: {title}")
+        raw_response = None
+        try:
+            raw_response, data = self.request_model_json([
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": title}
+            ], 'parsed_title', PARSED_TITLE_SCHEMA)
+            return validate_parsed_title(data)
+        except ModelOutputError as e:
+            self.model_failures.record(e.kind)
+            debug_log(f"Invalid model reply for title '{title}': {str(e)}")
+            if not e.repairable:
+                raise
+            try:
+                result = validate_parsed_title(
+                    self.repair_model_json(e.reply or raw_response, e, 'parsed_title', PARSED_TITLE_SCHEMA))
+            except ModelOutputError as repair_error:
+                self.model_failures.record(repair_error.kind)
+                self.model_failures.record_repair(False)
+                raise
+            self.model_failures.record_repair(True)
+            return result
@@ -0,0 +1,55 @@
+"""
+Compare nyaa result-page extraction: the streaming extract_result_rows against the
+previous BeautifulSoup implementation, on the saved pages in benchmarks/fixtures.
+
+    python benchmarks/bench_extract.py [--repeat N]
+
+Needs beautifulsoup4 for the reference path only.
+"""
+import argparse
+import glob
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from bs4 import BeautifulSoup
+from anime_tracker_engine import extract_result_rows
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+def extract_result_rows_bs4(html: str):
+    """The BeautifulSoup extraction previously used by search_episode."""
+    soup = BeautifulSoup(html, 'html.parser')
+    rows = []
+    for row in soup.select('tr.danger, tr.default, tr.success'):
+        title_anchor = row.select_one('a[href^="/view/"]:not(.comments)')
+        magnet_tag = row.select_one('a[href^="magnet:"]')
+        if title_anchor and magnet_tag:
+            rows.append({'title': title_anchor.text.strip(), 'magnet': magnet_tag['href']})
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    for path in sorted(glob.glob(os.path.join(FIXTURES, '*.html'))):
+        with open(path, 'r', encoding='utf-8') as f:
+            html = f.read()
+
+        fast_rows = extract_result_rows(html)
+        reference_rows = extract_result_rows_bs4(html)
+        matches = [(row['title'], row['magnet']) for row in fast_rows] == \
+                  [(row['title'], row['magnet']) for row in reference_rows]
+
+        fast = min(timeit.repeat(lambda: extract_result_rows(html), number=args.repeat, repeat=3)) / args.repeat
+        reference = min(timeit.repeat(lambda: extract_result_rows_bs4(html), number=args.repeat, repeat=3)) / args.repeat
+        print(f"{os.path.basename(path)}: {len(fast_rows)} rows, {len(html) // 1024} KiB, "
+              f"results {'match' if matches else 'DIFFER'}")
+        print(f"  streaming     {fast * 1000:8.2f} ms/page")
+        print(f"  beautifulsoup {reference * 1000:8.2f} ms/page  ({reference / fast:.1f}x slower)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,572 @@
+"""
+Tests for the scanning engine: title parsing and matching, episode sets, the known-shows
+catalog, state and response storage, model reply handling, feed mode and poll scheduling.
+Network and model calls are stubbed.
+"""
+import io
+import json
+import sqlite3
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+import requests
+from openai import RateLimitError
+
+from anime_tracker_engine import (
+    CandidateFilter, EpisodeSet, KnownShows, MagnetSink, ModelOutputError, PollScheduler, PrintSink, ResponseCache,
+    ShowIndex, SqliteStateStore, TitleFastParser, TrackerEngine, WatchDirSink, current_timestamp, make_sink,
+    validate_parsed_title
+)
+
+KNOWN_SHOWS = {
+    'Frieren': {'episodes_per_season': [28]},
+    'Kaiju No. 8': {'episodes_per_season': [12]},
+    'One Piece': {'episodes_per_season': [61, 16, 14]}
+}
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with open('known_shows.json', 'w') as f:
+        json.dump(KNOWN_SHOWS, f)
+    engine = TrackerEngine({'metrics_file': None}, sink=PrintSink(io.StringIO()))
+    yield engine
+    engine.close()
+
+def track(engine, name, quality='1080p', start_season=1, end_season=1, end_episode=12, **extra):
+    return engine.add_show({
+        'names': [name], 'quality': quality,
+        'start_season': start_season, 'start_episode': 1,
+        'end_season': end_season, 'end_episode': end_episode,
+        **extra
+    })
+
+def serve_rows(engine, titles):
+    rows = [{'title': title, 'magnet': f"magnet:?xt=urn:btih:{index:040x}", 'seeders': 10}
+            for index, title in enumerate(titles, start=1)]
+    engine.fetch_search_rows = lambda params: rows
+
+# --- TitleFastParser ---
+@pytest.mark.parametrize("title, show, season, episode, batch_episodes", [
+    ("[SubsPlease] Frieren - 05 (1080p) [ABCD1234].mkv", "Frieren", None, 5, []),
+    ("[Erai-raws] Frieren S2 - 03 [1080p][Multiple Subtitle]", "Frieren", 2, 3, []),
+    ("Frieren.S01E07.1080p.WEB.x264", "Frieren", 1, 7, []),
+    ("[SubsPlease] Frieren 2nd Season - 04 (720p)", "Frieren", 2, 4, []),
+    ("[Erai-raws] Frieren (01-12) [1080p][Batch]", "Frieren", None, None, list(range(1, 13))),
+    ("[SubsPlease] Kaiju No. 8 - 01 (1080p)", "Kaiju No. 8", None, 1, []),
+])
+def test_fast_parser_layouts(title, show, season, episode, batch_episodes):
+    _, parsed = TitleFastParser().parse(title)
+    assert (parsed['show'], parsed['season'], parsed['episode'], parsed['batch_episodes']) == \
+           (show, season, episode, batch_episodes)
+
+@pytest.mark.parametrize("title", [
+    "Frieren - 05",                                   # no quality, leave it to the model
+    "[Group] Frieren - 05 [1080p][Batch]",            # single episode tagged as batch
+    "[SubsPlease] Frieren - 05.5 (1080p)",            # decimal recap, not episode 5
+    "[SubsPlease] Frieren S01E05.5 (1080p)",
+])
+def test_fast_parser_defers_to_model(title):
+    assert TitleFastParser().parse(title) is None
+
+def test_dotted_show_name_is_kept(engine):
+    show = track(engine, "Kaiju No. 8")
+    serve_rows(engine, ["[SubsPlease] Kaiju No. 8 - 01 (1080p)"])
+    assert engine.search_episode(show, 1, 1)
+    assert (1, 1) in show['downloaded_episodes']
+
+def test_decimal_recap_is_not_the_episode(engine):
+    show = track(engine, "Frieren")
+    engine.parse_titles_with_model = lambda titles: [None] * len(titles)
+    serve_rows(engine, ["[SubsPlease] Frieren - 05.5 (1080p)"])
+    assert not engine.search_episode(show, 1, 5)
+    assert (1, 5) in show['needed_episodes']
+
+def test_batch_range_only_credits_its_episodes(engine):
+    show = track(engine, "Frieren", end_episode=28)
+    for episode in range(1, 13):
+        engine.mark_downloaded(show, [(1, episode)])
+    serve_rows(engine, ["[Erai-raws] Frieren (01-12) [1080p][Batch]"])
+    assert not engine.search_episode(show, 1, 13)
+    assert not engine.search_season_batch(show, 1, list(range(13, 29)))
+    assert len(show['needed_episodes']) == 16
+
+def test_batch_range_credits_needed_part(engine):
+    show = track(engine, "Frieren", end_episode=28)
+    serve_rows(engine, ["[Erai-raws] Frieren (01-12) [1080p][Batch]"])
+    assert engine.search_episode(show, 1, 3)
+    assert sorted(show['downloaded_episodes']) == [(1, episode) for episode in range(1, 13)]
+
+# --- CandidateFilter ---
+@pytest.mark.parametrize("title, batch_only, score", [
+    ("[SubsPlease] Frieren S2 - 05 (1080p)", False, CandidateFilter.EXACT),
+    ("Frieren.S02E05.1080p.WEB", False, CandidateFilter.EXACT),
+    ("[SubsPlease] Frieren - 33 (1080p)", False, CandidateFilter.DASH),   # absolute number
+    ("[SubsPlease] Frieren - 05 (1080p)", False, CandidateFilter.DASH),
+    ("[Erai-raws] Frieren S02 [1080p][Batch]", False, CandidateFilter.BATCH),
+    ("[Erai-raws] Frieren (29-40) [1080p]", False, CandidateFilter.BATCH),
+    ("[SubsPlease] Frieren S2 - 05 (720p)", False, 0),                     # wrong quality
+    ("[SubsPlease] Frieren S2 - 06 (1080p)", False, 0),                    # wrong episode
+    ("[SubsPlease] Frierenx S2 - 05 (1080p)", False, 0),                   # alias not a whole word
+    ("[SubsPlease] Frieren S2 - 05 (1080p)", True, 0),                     # single episode, batch search
+    ("[Erai-raws] Frieren S02 [1080p][Batch]", True, CandidateFilter.BATCH),
+    ("[Erai-raws] Frieren (13-24) [1080p]", True, 0),                      # range misses the episode
+    ("[SubsPlease] Frieren S2 - 05.5 (1080p)", False, 0),                  # decimal recap
+])
+def test_candidate_filter_scores(title, batch_only, score):
+    candidate_filter = CandidateFilter(["Frieren"], '1080p', 2, 5, 33, batch_only=batch_only)
+    assert candidate_filter.score(title) == score
+
+def test_candidate_filter_ranks_by_score_then_seeders():
+    candidate_filter = CandidateFilter(["Frieren"], '1080p', 2, 5, 33)
+    rows = [
+        {'title': "[A] Frieren - 05 (1080p)", 'seeders': 900},
+        {'title': "[B] Frieren S2 - 05 (1080p)", 'seeders': 10},
+        {'title': "[C] Frieren S2 - 05 (1080p)", 'seeders': 50},
+        {'title': "[D] Other Show - 05 (1080p)", 'seeders': 999},
+    ]
+    assert [row['title'][1] for row in candidate_filter.rank(rows)] == ["C", "B", "A"]
+
+# --- EpisodeSet ---
+def test_episode_set_ranges_and_json():
+    episodes = EpisodeSet()
+    episodes.add_range(1, 1, 12)
+    episodes.add(2, 5)
+    episodes.add(2, 3)
+    episodes.discard(1, 7)
+    assert len(episodes) == 13 and (1, 12) in episodes and (1, 7) not in episodes
+    assert episodes.to_json() == {'1': "1-6,8-12", '2': "3,5"}
+    assert EpisodeSet.from_json(episodes.to_json()) == episodes
+    assert EpisodeSet.from_json([[1, 2], [1, 3]]) == EpisodeSet([(1, 2), (1, 3)])
+    assert episodes.first() == (1, 1)
+    assert episodes.count_range(1, 5, 9) == 4
+    assert episodes.season_episodes(2) == [3, 5]
+
+def test_episode_set_difference_drops_empty_seasons():
+    needed = EpisodeSet([(1, 1), (1, 2), (2, 1)])
+    needed.difference_update(EpisodeSet([(1, 1), (1, 2)]))
+    assert list(needed) == [(2, 1)] and needed.first() == (2, 1)
+    needed.discard(2, 1)
+    assert not needed and needed.first() is None
+
+# --- SqliteStateStore ---
+def stored_show(show_id, name, downloaded=(), needed=()):
+    return {
+        'id': show_id, 'names': [name], 'quality': '1080p', 'last_checked': None,
+        'downloaded_episodes': EpisodeSet(downloaded), 'needed_episodes': EpisodeSet(needed)
+    }
+
+def reload(path):
+    store = SqliteStateStore(path)
+    try:
+        return store.load()
+    finally:
+        store.close()
+
+def summary(shows):
+    return [(show['id'], show['names'][0], sorted(show['downloaded_episodes']), sorted(show['needed_episodes']))
+            for show in shows]
+
+@pytest.fixture
+def state_path(tmp_path):
+    return str(tmp_path / 'tracked_shows.db')
+
+def test_state_store_round_trip(state_path):
+    shows = [stored_show('a', "Frieren", [(1, 1)], [(1, 2), (1, 3)]), stored_show('b', "Kaiju No. 8", needed=[(1, 1)])]
+    store = SqliteStateStore(state_path)
+    store.save(shows)
+    store.close()
+    assert summary(reload(state_path)) == summary(shows)
+
+def test_state_store_saves_changes_removals_and_order(state_path):
+    a, b, c = stored_show('a', "Frieren", needed=[(1, 1), (1, 2)]), stored_show('b', "Kaiju No. 8"), stored_show('c', "Oshi no Ko")
+    store = SqliteStateStore(state_path)
+    store.save([a, b, c])
+
+    a['needed_episodes'].discard(1, 1)
+    a['downloaded_episodes'].add(1, 1)
+    a['last_checked'] = "2026-10-17 12:00:00"
+    store.save([c, a], dirty_ids={'a'})
+    store.close()
+
+    loaded = reload(state_path)
+    assert summary(loaded) == summary([c, a])
+    assert loaded[1]['last_checked'] == "2026-10-17 12:00:00"
+    conn = sqlite3.connect(state_path)
+    assert conn.execute("SELECT COUNT(*) FROM episodes WHERE show_id = 'b'").fetchone()[0] == 0
+    conn.close()
+
+def test_state_store_skips_shows_outside_dirty_ids(state_path):
+    a, b = stored_show('a', "Frieren", needed=[(1, 1)]), stored_show('b', "Kaiju No. 8", needed=[(1, 1)])
+    store = SqliteStateStore(state_path)
+    store.save([a, b])
+    a['needed_episodes'].add(1, 2)
+    b['needed_episodes'].add(1, 2)
+    store.save([a, b], dirty_ids={'a'})
+    store.close()
+    loaded = {show['id']: show for show in reload(state_path)}
+    assert sorted(loaded['a']['needed_episodes']) == [(1, 1), (1, 2)]
+    assert sorted(loaded['b']['needed_episodes']) == [(1, 1)]
+
+def test_state_store_imports_legacy_json_once(tmp_path, state_path):
+    legacy = tmp_path / 'tracked_shows.json'
+    legacy.write_text(json.dumps([{
+        'names': ["Frieren"], 'quality': '1080p',
+        'downloaded_episodes': [[1, 1], [1, 2]], 'needed_episodes': [[1, 3]]
+    }]))
+    store = SqliteStateStore(state_path)
+    assert store.import_json(str(legacy)) == 1
+    assert store.import_json(str(legacy)) == 0
+    store.close()
+    [show] = reload(state_path)
+    assert show['names'] == ["Frieren"] and show['id']
+    assert sorted(show['downloaded_episodes']) == [(1, 1), (1, 2)]
+    assert sorted(show['needed_episodes']) == [(1, 3)]
+
+# --- KnownShows ---
+@pytest.mark.parametrize("absolute, expected", [
+    (1, (1, 1)),
+    (61, (1, 61)),
+    (62, (2, 1)),
+    (91, (3, 14)),
+    (92, None),           # past the listed seasons
+    (1080, None),
+    (0, None),
+])
+def test_known_shows_season_episode(absolute, expected):
+    catalog = KnownShows(KNOWN_SHOWS)
+    assert catalog.season_episode("One Piece", absolute) == expected
+
+def test_known_shows_uniform_and_unknown():
+    catalog = KnownShows({'Bleach': {'episodes_per_season': 13}})
+    assert catalog.season_episode("bleach", 27) == (3, 1)
+    assert catalog.absolute_episode("Bleach", 3, 1) == 27
+    assert catalog.episodes_in_season("Bleach", 9) == 13
+    assert catalog.season_episode("Naruto", 5) is None
+
+def test_absolute_number_past_catalog_goes_to_model(engine):
+    assert engine.fast_parse_title("[Judas] One Piece - 1080 [1080p]") is None
+    parsed = engine.fast_parse_title("[Judas] One Piece - 63 [1080p]")
+    assert (parsed['season'], parsed['episode']) == (2, 2)
+
+def test_search_credits_rows_of_other_tracked_shows(engine):
+    frieren = track(engine, "Frieren", end_episode=28)
+    kaiju = track(engine, "Kaiju No. 8")
+    engine.parse_titles_with_model = lambda titles: pytest.fail("no model call expected")
+    serve_rows(engine, ["[SubsPlease] Kaiju No. 8 - 03 (1080p)", "[SubsPlease] Frieren - 05 (1080p)"])
+    assert engine.search_episode(frieren, 1, 5)
+    assert (1, 3) in kaiju['downloaded_episodes']
+
+# --- ShowIndex ---
+def test_show_index_resolves_exact_aliases_only():
+    mob = {'names': ["Mob Psycho 100"]}
+    aot = {'names': ["Attack on Titan", "Shingeki no Kyojin"]}
+    index = ShowIndex([mob, aot])
+    assert index.resolve("mob psycho 100") == [mob]
+    assert index.resolve("Shingeki no Kyojin") == [aot]
+    assert index.resolve("Mob Psycho 100 III") == []
+    assert index.resolve("Attack on Titan Final Season") == []
+    assert index.near_miss("Mob Psycho 100 III") and index.near_miss("Attack on Titan Final Season")
+    assert not index.near_miss("Attack on Titan") and not index.near_miss("Frieren")
+
+def test_show_index_keeps_every_entry_of_a_shared_name():
+    hd, sd = {'names': ["Frieren"]}, {'names': ["Frieren"]}
+    index = ShowIndex([hd, sd])
+    assert index.resolve("Frieren") == [hd, sd]
+    assert index.matches("Frieren", sd)
+
+@pytest.mark.parametrize("name, title, model_reply", [
+    ("Mob Psycho 100", "[SubsPlease] Mob Psycho 100 III - 05 (1080p)",
+     {'show': "Mob Psycho 100", 'season': 3, 'episode': 5}),
+    ("Attack on Titan", "[SubsPlease] Attack on Titan Final Season - 05 (1080p)",
+     {'show': "Attack on Titan", 'season': 4, 'episode': 5}),
+])
+def test_sequel_titles_go_to_the_model(engine, name, title, model_reply):
+    show = track(engine, name)
+    asked = []
+
+    def parse_with_model(titles):
+        asked.extend(titles)
+        return [{**model_reply, 'is_batch': False, 'quality': '1080p', 'batch_episodes': []} for _ in titles]
+    engine.parse_titles_with_model = parse_with_model
+    serve_rows(engine, [title])
+    assert not engine.search_episode(show, 1, 5)
+    assert asked == [title]
+    assert (1, 5) in show['needed_episodes']
+
+def test_show_tracked_at_two_qualities(engine):
+    hd = track(engine, "Frieren", quality='1080p')
+    sd = track(engine, "Frieren", quality='720p')
+    parsed = {'show': "Frieren", 'season': 1, 'episode': 2, 'is_batch': False, 'quality': '720p', 'batch_episodes': []}
+    assert engine.is_valid_episode(sd, 1, 2, parsed)
+    assert not engine.is_valid_episode(hd, 1, 2, parsed)
+    assert engine.credit_parsed_release(parsed, "[SubsPlease] Frieren - 02 (720p)", "magnet:?xt=urn:btih:" + "1" * 40)
+    assert (1, 2) in sd['downloaded_episodes'] and (1, 2) in hd['needed_episodes']
+
+def test_show_split_into_season_entries(engine):
+    track(engine, "Oshi no Ko", end_episode=11)
+    second = track(engine, "Oshi no Ko", start_season=2, end_season=2, end_episode=13)
+    parsed = {'show': "Oshi no Ko", 'season': 2, 'episode': 1, 'is_batch': False, 'quality': '1080p', 'batch_episodes': []}
+    assert engine.is_valid_episode(second, 2, 1, parsed)
+    assert engine.credit_parsed_release(parsed, "[SubsPlease] Oshi no Ko S2 - 01 (1080p)", "magnet:?xt=urn:btih:" + "2" * 40)
+    assert (2, 1) in second['downloaded_episodes']
+
+# --- Feed mode ---
+FEED_ITEM = """<item><title>{title}</title><guid>https://nyaa.si/view/{id}</guid>
+<nyaa:infoHash>{hash}</nyaa:infoHash><pubDate>Sat, 17 Oct 2026 01:00:00 -0000</pubDate></item>"""
+
+def serve_feed(engine, uploads):
+    items = "".join(FEED_ITEM.format(id=upload_id, title=title, hash=f"{upload_id:040x}") for upload_id, title in uploads)
+    body = f'<rss xmlns:nyaa="https://nyaa.si/xmlns/nyaa"><channel>{items}</channel></rss>'.encode()
+
+    class Response:
+        content = body
+
+        def raise_for_status(self):
+            pass
+    engine.http.get = lambda url, params=None: Response()
+
+def test_feed_retries_uploads_that_failed_to_parse(engine):
+    show = track(engine, "Frieren", end_episode=28)
+    engine.feed_state = {'last_seen_id': 100}
+    serve_feed(engine, [(101, "[SubsPlease] Frieren - 05 (1080p)")])
+
+    real_parse_titles = engine.parse_titles
+    engine.parse_titles = lambda titles: [None] * len(titles)
+    engine.scan_feed()
+    assert (1, 5) in show['needed_episodes']
+
+    engine.parse_titles = real_parse_titles
+    engine.scan_feed()
+    assert (1, 5) in show['downloaded_episodes']
+    assert engine.feed_state['last_seen_id'] == 101 and not engine.feed_state['retry_ids']
+
+def test_feed_skips_uploads_of_untracked_shows(engine):
+    show = track(engine, "Frieren", end_episode=28)
+    engine.feed_state = {'last_seen_id': 100}
+    serve_feed(engine, [(102, "[SubsPlease] Frieren - 06 (1080p)"), (101, "Some Other Show Episode 5 1080p")])
+    parsed_titles = []
+    real_parse_titles = engine.parse_titles
+
+    def parse_titles(titles):
+        parsed_titles.extend(titles)
+        return real_parse_titles(titles)
+    engine.parse_titles = parse_titles
+    engine.scan_feed()
+    assert parsed_titles == ["[SubsPlease] Frieren - 06 (1080p)"]
+    assert (1, 6) in show['downloaded_episodes']
+    assert engine.feed_state['last_seen_id'] == 102
+
+# --- Model replies ---
+def model_item(show, episode, **extra):
+    return {'show': show, 'season': 1, 'episode': episode, 'is_batch': False, 'quality': '1080p',
+            'batch_episodes': [], **extra}
+
+def stub_model(engine, *replies):
+    """Answer request_model_json with the given replies in turn (exceptions are raised), recording the requests."""
+    requests_seen = []
+
+    def request_model_json(messages, schema_name, schema):
+        requests_seen.append(messages)
+        data = replies[len(requests_seen) - 1]
+        if isinstance(data, Exception):
+            raise data
+        return json.dumps(data), data
+    engine.request_model_json = request_model_json
+    return requests_seen
+
+TITLES = ["Alpha - 01 720x", "Beta - 02 720x", "Gamma - 03 720x"]
+
+def test_batch_reply_missing_a_title_is_aligned_by_index(engine):
+    stub_model(engine, {'results': [model_item("Alpha", 1, index=0), model_item("Gamma", 3, index=2)]})
+    results = engine.parse_titles(TITLES)
+    assert [result and result['show'] for result in results] == ["Alpha", None, "Gamma"]
+    assert engine.parse_cache.get(TITLES[1], engine.parse_context_key()) is None
+    assert engine.model_failures.failures == {'count_mismatch': 1}
+
+def test_batch_reply_without_usable_indexes_parses_nothing(engine):
+    stub_model(engine, {'results': [model_item("Alpha", 1), model_item("Beta", 2, index=1),
+                                    model_item("Gamma", 3, index=1), model_item("Delta", 4, index=7)]})
+    assert engine.parse_titles_with_model(TITLES) == [None, None, None]
+
+@pytest.mark.parametrize("changes, kind", [
+    ({}, None),
+    ({'episode': None, 'is_batch': True, 'batch_episodes': [1, 2]}, None),
+    ({'season': True}, 'wrong_type'),                    # bool is not an int
+    ({'episode': False}, 'wrong_type'),
+    ({'season': "1"}, 'wrong_type'),
+    ({'episode': None}, 'wrong_type'),                   # no episode and not a batch
+    ({'is_batch': "false"}, 'wrong_type'),
+    ({'show': "  "}, 'wrong_type'),
+    ({'batch_episodes': [1, True]}, 'wrong_type'),
+    ({'quality': None}, 'wrong_type'),
+])
+def test_validate_parsed_title(changes, kind):
+    data = {**model_item("Frieren", 5), **changes}
+    if kind is None:
+        assert validate_parsed_title(data) == data
+    else:
+        with pytest.raises(ModelOutputError) as error:
+            validate_parsed_title(data)
+        assert error.value.kind == kind
+
+@pytest.mark.parametrize("data, kind", [
+    ({'show': "Frieren", 'season': 1}, 'missing_field'),
+    (["Frieren", 1, 5], 'not_object'),
+])
+def test_validate_parsed_title_shape(data, kind):
+    with pytest.raises(ModelOutputError) as error:
+        validate_parsed_title(data)
+    assert error.value.kind == kind
+
+@pytest.mark.parametrize("first_reply", [
+    ModelOutputError('invalid_json', "Expecting value", reply="{'show': 'Frieren'"),
+    {**model_item("Frieren", 5), 'season': "1"},
+])
+def test_single_parse_is_repaired_once(engine, first_reply):
+    requests_seen = stub_model(engine, first_reply, model_item("Frieren", 5))
+    assert engine.parse_title_with_model("Frieren ep 5")['episode'] == 5
+    assert len(requests_seen) == 2
+    assert "Error:" in requests_seen[1][1]['content']
+    assert (engine.model_failures.repairs, engine.model_failures.repaired) == (1, 1)
+
+def test_single_parse_gives_up_after_one_repair(engine):
+    stub_model(engine, {**model_item("Frieren", 5), 'episode': None}, {**model_item("Frieren", 5), 'season': None})
+    with pytest.raises(ModelOutputError):
+        engine.parse_title_with_model("Frieren ep 5")
+    assert (engine.model_failures.repairs, engine.model_failures.repaired) == (1, 0)
+
+def test_unrepairable_reply_is_not_re_asked(engine):
+    requests_seen = stub_model(engine, ModelOutputError('refusal', "can't help with that"))
+    with pytest.raises(ModelOutputError):
+        engine.parse_title_with_model("Frieren ep 5")
+    assert len(requests_seen) == 1
+
+def test_invalid_batch_items_are_repaired_together(engine):
+    requests_seen = stub_model(
+        engine,
+        {'results': [model_item("Alpha", 1, index=0), model_item("Beta", 2, index=1, season=True),
+                     model_item("Gamma", 3, index=2, is_batch="no")]},
+        {'results': [model_item("Gamma", 3, index=2), model_item("Beta", 2, index=1)]}
+    )
+    results = engine.parse_titles_with_model(TITLES)
+    assert [(result['show'], result['episode']) for result in results] == [("Alpha", 1), ("Beta", 2), ("Gamma", 3)]
+    assert len(requests_seen) == 2
+    assert (engine.model_failures.repairs, engine.model_failures.repaired) == (1, 1)
+
+def test_failed_batch_repair_leaves_items_unparsed(engine):
+    stub_model(
+        engine,
+        {'results': [model_item("Alpha", 1, index=0), model_item("Beta", 2, index=1, season=True),
+                     model_item("Gamma", 3, index=2)]},
+        ModelOutputError('api_error', "timeout")
+    )
+    results = engine.parse_titles_with_model(TITLES)
+    assert [result and result['show'] for result in results] == ["Alpha", None, "Gamma"]
+
+def test_model_rate_limits_slow_the_buckets_and_retry(engine):
+    class Throttled(RateLimitError):
+        def __init__(self):
+            Exception.__init__(self, "429 slow down")
+    replies = [Throttled(), Throttled(), "ok"]
+
+    def create(**kwargs):
+        reply = replies.pop(0)
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+    engine._openai_client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    bucket = engine.rate_limits.bucket(f"openai:{engine.config['openai_model']}")
+    rate = bucket.rate
+
+    assert engine.create_chat_completion([{'role': 'user', 'content': "x"}]) == "ok"
+    assert bucket.rate < rate
+    assert engine.metrics.scan['counters']['model_rate_limited'] == 2
+
+# --- Magnet sinks ---
+def test_magnet_sinks(tmp_path):
+    with pytest.raises(TypeError):
+        MagnetSink()
+    with pytest.raises(ValueError):
+        make_sink("bogus")
+    sink = make_sink(f"watch:{tmp_path / 'watch'}")
+    assert isinstance(sink, WatchDirSink)
+    sink.send("magnet:?xt=urn:btih:" + "a" * 40, "title")
+    assert (tmp_path / 'watch' / ("a" * 40 + ".magnet")).read_text().startswith("magnet:")
+
+# --- ResponseCache ---
+def test_response_cache_evicts_oldest_pages_in_batches(tmp_path):
+    cache = ResponseCache(str(tmp_path / 'responses.db'), max_entries=20)
+    for number in range(50):
+        cache.put(f"page{number}", None, None, "hash", [{'title': str(number)}])
+    assert cache.size <= 20
+    assert cache.get("page49")['rows'] == [{'title': "49"}]
+    assert cache.get("page0") is None
+    cache.close()
+
+# --- PollScheduler ---
+DAY = 24 * 3600
+START = datetime(2026, 10, 1).timestamp()
+
+def stamp(seconds: float) -> str:
+    return datetime.fromtimestamp(seconds).strftime("%Y-%m-%d %H:%M:%S")
+
+def scheduler() -> PollScheduler:
+    return PollScheduler(min_interval=900, base_interval=6 * 3600, max_interval=7 * DAY, backoff_factor=2.0)
+
+def weekly_show(last_checked: float, idle_scans: int = 0) -> dict:
+    return {
+        'needed_episodes': EpisodeSet([(1, 5)]),
+        'found_at': [stamp(START - 14 * DAY), stamp(START - 7 * DAY), stamp(START)],
+        'last_checked': stamp(last_checked),
+        'idle_scans': idle_scans
+    }
+
+@pytest.mark.parametrize("checked_day", [0, 1, 3, 3.5, 6])
+def test_weekly_show_is_due_a_week_after_its_last_find(checked_day):
+    show = weekly_show(START + checked_day * DAY, idle_scans=1 if checked_day else 0)
+    assert scheduler().next_due(show, START + checked_day * DAY) == START + 7 * DAY
+
+def test_overdue_show_backs_off_from_last_check():
+    checked = START + 8 * DAY
+    assert scheduler().next_due(weekly_show(checked, idle_scans=0), checked) == checked + 900
+    assert scheduler().next_due(weekly_show(checked, idle_scans=3), checked) == checked + 900 * 8
+
+def test_show_without_cadence_or_needs():
+    show = {'needed_episodes': EpisodeSet([(1, 1)]), 'found_at': [], 'last_checked': stamp(START), 'idle_scans': 2}
+    assert scheduler().next_due(show, START) == START + 4 * 6 * 3600
+    show['needed_episodes'] = EpisodeSet()
+    assert scheduler().next_due(show, START) == START + 7 * DAY
+    assert scheduler().next_due({'needed_episodes': EpisodeSet(), 'last_checked': None}, START) == START
+
+def test_catch_up_finds_are_not_a_cadence():
+    show = weekly_show(START)
+    show['found_at'] = [stamp(START + seconds) for seconds in (0, 5, 9, 14)]
+    assert scheduler().cadence(show) is None
+
+def test_backlog_catch_up_records_one_find(engine):
+    show = track(engine, "Frieren", end_episode=28)
+    for episode in range(1, 13):
+        engine.mark_downloaded(show, [(1, episode)])
+    assert len(show['found_at']) == 1
+
+def test_failed_searches_do_not_count_as_idle(engine):
+    show = track(engine, "Frieren")
+
+    def unreachable(params):
+        raise requests.ConnectionError("nyaa.si unreachable")
+    engine.fetch_search_rows = unreachable
+    for _ in range(3):
+        engine.scan_show(show)
+    assert show['idle_scans'] == 0 and show['last_checked']
+
+    serve_rows(engine, [])
+    engine.scan_show(show)
+    assert show['idle_scans'] == 1
+
+def test_feed_poll_interval(engine):
+    assert engine.next_feed_poll_time() <= time.time()
+    engine.feed_state['checked_at'] = current_timestamp()
+    assert engine.next_feed_poll_time() > time.time() + 800